@@ -0,0 +1,134 @@
+"""
+In-memory stand-in for the parts of the Apify API the LinkedIn enrichment
+uses: starting an actor run, waiting on it, and reading its dataset.
+
+    python -m bench.fake_apify          # from backend/, listens on :8094
+    APIFY_API_URL=http://127.0.0.1:8094 APIFY_TOKEN=bench LINKEDIN_ENABLED=true uvicorn main:app
+
+Every run succeeds FAKE_APIFY_RUN_MS after it starts and yields
+FAKE_APIFY_POSTS posts for each URL in its input.
+"""
+import asyncio
+import gzip
+import itertools
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+FAKE_APIFY_PORT = int(os.getenv("FAKE_APIFY_PORT", "8094"))
+FAKE_APIFY_RUN_MS = float(os.getenv("FAKE_APIFY_RUN_MS", "2000"))
+FAKE_APIFY_POSTS = int(os.getenv("FAKE_APIFY_POSTS", "3"))
+
+app = FastAPI()
+runs: Dict[str, dict] = {}
+datasets: Dict[str, list] = {}
+stats = {"runs": 0, "urls": 0}
+_ids = itertools.count(1)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _run(run_id: str) -> dict:
+    """The run as Apify reports it, SUCCEEDED once FAKE_APIFY_RUN_MS has passed."""
+    run = runs[run_id]
+    finished = time.monotonic() >= run["_finishes"]
+    return {
+        "id": run_id,
+        "actId": run["actId"],
+        "status": "SUCCEEDED" if finished else "RUNNING",
+        "startedAt": run["startedAt"],
+        "finishedAt": _now() if finished else None,
+        "defaultDatasetId": run["defaultDatasetId"],
+        "defaultKeyValueStoreId": f"kvs-{run_id}",
+        "defaultRequestQueueId": f"rq-{run_id}",
+    }
+
+
+async def _wait(run_id: str, wait_for_finish: float) -> dict:
+    deadline = time.monotonic() + min(wait_for_finish, 60)
+    while _run(run_id)["status"] == "RUNNING" and time.monotonic() < deadline:
+        await asyncio.sleep(min(0.05, max(runs[run_id]["_finishes"] - time.monotonic(), 0.001)))
+    return _run(run_id)
+
+
+@app.post("/v2/acts/{actor}/runs")
+async def start_run(actor: str, request: Request):
+    body = await request.body()
+    # apify_client gzips the run input
+    if request.headers.get("content-encoding") == "gzip":
+        body = gzip.decompress(body)
+    run_input = json.loads(body or b"{}")
+    run_id = f"run{next(_ids)}"
+    dataset_id = f"ds-{run_id}"
+    urls = run_input.get("urls") or []
+    per_source = min(int(run_input.get("limitPerSource") or FAKE_APIFY_POSTS), FAKE_APIFY_POSTS)
+    datasets[dataset_id] = [
+        {
+            "inputUrl": url,
+            "url": f"https://www.linkedin.com/feed/update/urn:li:activity:{run_id}{index}{post}",
+            "text": f"Post {post + 1} from {url.rstrip('/').rsplit('/', 1)[-1]}: we just wrapped up a busy quarter.",
+        }
+        for index, url in enumerate(urls)
+        for post in range(per_source)
+    ]
+    runs[run_id] = {
+        "actId": actor.replace("~", "/"),
+        "startedAt": _now(),
+        "defaultDatasetId": dataset_id,
+        "_finishes": time.monotonic() + FAKE_APIFY_RUN_MS / 1000,
+    }
+    stats["runs"] += 1
+    stats["urls"] += len(urls)
+    run = await _wait(run_id, float(request.query_params.get("waitForFinish", 0)))
+    return JSONResponse({"data": run}, status_code=201)
+
+
+@app.get("/v2/actor-runs/{run_id}")
+async def get_run(run_id: str, request: Request):
+    if run_id not in runs:
+        return JSONResponse({"error": {"type": "record-not-found", "message": "Actor run was not found"}}, status_code=404)
+    return {"data": await _wait(run_id, float(request.query_params.get("waitForFinish", 0)))}
+
+
+@app.get("/v2/datasets/{dataset_id}/items")
+async def list_items(dataset_id: str, request: Request):
+    items = datasets.get(dataset_id, [])
+    offset = int(request.query_params.get("offset", 0))
+    limit = int(request.query_params.get("limit", len(items) or 1))
+    page = items[offset:offset + limit]
+    return JSONResponse(
+        page,
+        headers={
+            "x-apify-pagination-total": str(len(items)),
+            "x-apify-pagination-offset": str(offset),
+            "x-apify-pagination-limit": str(limit),
+            "x-apify-pagination-desc": "false",
+        },
+    )
+
+
+def reset():
+    runs.clear()
+    datasets.clear()
+    stats["runs"] = stats["urls"] = 0
+
+
+def start(port: int = FAKE_APIFY_PORT) -> uvicorn.Server:
+    """Runs the fake on its own thread; stop it with `server.should_exit = True`."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=FAKE_APIFY_PORT, log_level="warning")
@@ -0,0 +1,229 @@
+"""
+In-memory stand-in for the Supabase REST API (PostgREST), covering what the
+send cron uses: the `scheduled-emails` and `sent-emails` tables and the
+claim/release functions from sql/scheduled_emails_leasing.sql.
+
+    python -m bench.fake_supabase       # from backend/, listens on :8092
+    SUPABASE_URL=http://127.0.0.1:8092 SUPABASE_KEY=bench python -m lib.cron
+
+Supports the filters the code sends (eq, neq, gt, gte, lt, lte, is, in and
+their not. forms), select projections, order and limit. FAKE_SUPABASE_LATENCY_MS
+adds a delay to every request, roughly the round trip to the real project.
+"""
+import asyncio
+import itertools
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+FAKE_SUPABASE_PORT = int(os.getenv("FAKE_SUPABASE_PORT", "8092"))
+FAKE_SUPABASE_LATENCY_MS = float(os.getenv("FAKE_SUPABASE_LATENCY_MS", "0"))
+
+app = FastAPI()
+tables: Dict[str, List[dict]] = {"scheduled-emails": [], "sent-emails": []}
+stats = {"requests": 0}
+_ids = itertools.count(1)
+_lock = threading.Lock()
+
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+
+def _value(stored, raw: str):
+    """`raw` from the query string converted to the type of the stored value, for comparison."""
+    if isinstance(stored, bool):
+        return raw.lower() == "true"
+    if isinstance(stored, (int, float)):
+        return type(stored)(raw)
+    if isinstance(stored, str):
+        try:
+            return datetime.fromisoformat(raw), datetime.fromisoformat(stored)
+        except ValueError:
+            pass
+    return raw
+
+
+def _matches(row: dict, column: str, expression: str) -> bool:
+    negate = expression.startswith("not.")
+    if negate:
+        expression = expression[4:]
+    op, _, raw = expression.partition(".")
+    stored = row.get(column)
+    if op == "is":
+        result = stored is None if raw == "null" else str(stored).lower() == raw
+    elif op == "in":
+        options = [option.strip('"') for option in raw.strip("()").split(",") if option]
+        result = stored is not None and str(stored) in options
+    elif stored is None:
+        result = False
+    else:
+        value = _value(stored, raw)
+        if isinstance(value, tuple):
+            value, stored = value
+        result = {
+            "eq": lambda: stored == value,
+            "neq": lambda: stored != value,
+            "gt": lambda: stored > value,
+            "gte": lambda: stored >= value,
+            "lt": lambda: stored < value,
+            "lte": lambda: stored <= value,
+        }[op]()
+    return not result if negate else result
+
+
+def _filtered(table: str, request: Request) -> List[dict]:
+    filters = [(key, value) for key, value in request.query_params.multi_items() if key not in RESERVED_PARAMS]
+    return [row for row in tables.setdefault(table, []) if all(_matches(row, key, value) for key, value in filters)]
+
+
+def _shape(rows: List[dict], request: Request) -> List[dict]:
+    order = request.query_params.get("order")
+    if order:
+        for term in reversed(order.split(",")):
+            column, _, direction = term.partition(".")
+            rows = sorted(rows, key=lambda row: (row.get(column) is None, row.get(column)), reverse=direction.startswith("desc"))
+    offset = int(request.query_params.get("offset", 0))
+    rows = rows[offset:]
+    if "limit" in request.query_params:
+        rows = rows[:int(request.query_params["limit"])]
+    select = request.query_params.get("select", "*")
+    if select != "*":
+        columns = select.split(",")
+        rows = [{column: row.get(column) for column in columns} for row in rows]
+    return rows
+
+
+@app.middleware("http")
+async def latency(request: Request, call_next):
+    stats["requests"] += 1
+    if FAKE_SUPABASE_LATENCY_MS:
+        await asyncio.sleep(FAKE_SUPABASE_LATENCY_MS / 1000)
+    return await call_next(request)
+
+
+@app.get("/rest/v1/{table}")
+async def select_rows(table: str, request: Request):
+    with _lock:
+        return _shape(_filtered(table, request), request)
+
+
+@app.post("/rest/v1/rpc/{function}")
+async def rpc(function: str, request: Request):
+    params = await request.json()
+    now = datetime.now(timezone.utc)
+    with _lock:
+        if function == "claim_scheduled_emails":
+            start = datetime.fromisoformat(params["p_window_start"])
+            end = datetime.fromisoformat(params["p_window_end"])
+            after = params.get("p_after_time")
+            after = (datetime.fromisoformat(after), params["p_after_id"]) if after else None
+            key = lambda row: (datetime.fromisoformat(row["scheduled_time"]), row["id"])
+            due = sorted(
+                (
+                    row for row in tables["scheduled-emails"]
+                    if row.get("sent") is False
+                    and not row.get("send_error")
+                    and start <= datetime.fromisoformat(row["scheduled_time"]) <= end
+                    and (not row.get("lease_expires_at") or datetime.fromisoformat(row["lease_expires_at"]) < now)
+                    and (after is None or key(row) > after)
+                ),
+                key=key,
+            )[:params["p_limit"]]
+            for row in due:
+                row["lease_token"] = params["p_token"]
+                row["lease_owner"] = params["p_owner"]
+                row["lease_expires_at"] = (now + timedelta(seconds=params["p_lease_seconds"])).isoformat()
+            return _shape(due, request)
+        if function == "release_scheduled_emails":
+            for row in tables["scheduled-emails"]:
+                if row.get("lease_token") == params["p_token"] and row["id"] in params["p_ids"]:
+                    row["lease_token"] = row["lease_owner"] = row["lease_expires_at"] = None
+            return None
+    return JSONResponse({"message": f"function {function} not found"}, status_code=404)
+
+
+@app.post("/rest/v1/{table}")
+async def insert_rows(table: str, request: Request):
+    body = await request.json()
+    rows = body if isinstance(body, list) else [body]
+    # upsert(..., on_conflict=column, ignore_duplicates=True) skips rows whose column value is taken
+    conflict = request.query_params.get("on_conflict")
+    ignore = "resolution=ignore-duplicates" in request.headers.get("prefer", "")
+    with _lock:
+        existing = tables.setdefault(table, [])
+        if conflict and ignore:
+            taken = {row.get(conflict) for row in existing}
+            rows = [row for row in rows if row.get(conflict) not in taken]
+        inserted = [{**row, "id": row.get("id") or next(_ids)} for row in rows]
+        existing.extend(inserted)
+    return JSONResponse(inserted, status_code=201)
+
+
+@app.patch("/rest/v1/{table}")
+async def update_rows(table: str, request: Request):
+    changes = await request.json()
+    with _lock:
+        rows = _filtered(table, request)
+        for row in rows:
+            row.update(changes)
+    return rows
+
+
+@app.delete("/rest/v1/{table}")
+async def delete_rows(table: str, request: Request):
+    with _lock:
+        rows = _filtered(table, request)
+        doomed = {id(row) for row in rows}
+        tables[table] = [row for row in tables.get(table, []) if id(row) not in doomed]
+    return rows
+
+
+def seed_scheduled(count: int, mailboxes: List[str], at: datetime = None) -> List[dict]:
+    """Adds `count` unsent rows due at `at` (default now), spread over the mailboxes."""
+    at = at or datetime.now(timezone.utc)
+    rows = [
+        {
+            "id": next(_ids),
+            "recipient": f"lead{index}@example.com",
+            "subject": f"Quick question {index}",
+            "body_text": f"Hey Lead{index},\n\nSo am not sure if this will work for you but I figured I'd reach out anyway.\n\nPetrus",
+            "sender_name": "Petrus",
+            "mailbox": mailboxes[index % len(mailboxes)],
+            "scheduled_time": at.isoformat(),
+            "sent": False,
+            "mime_payload": None,
+            "mime_hash": None,
+            "lease_token": None,
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "send_error": None,
+        }
+        for index in range(count)
+    ]
+    with _lock:
+        tables["scheduled-emails"].extend(rows)
+    return rows
+
+
+def reset():
+    with _lock:
+        for rows in tables.values():
+            rows.clear()
+        stats["requests"] = 0
+
+
+def start(port: int = FAKE_SUPABASE_PORT) -> uvicorn.Server:
+    """Runs the fake on its own thread; stop it with `server.should_exit = True`."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=FAKE_SUPABASE_PORT, log_level="warning")
@@ -0,0 +1,59 @@
+"""
+Fires concurrent generateCustomEmail calls at the stub LLM and reports latency.
+
+    python -m bench.stub_llm &
+    LLM_ENABLED=true LLM_BASE_URL=http://localhost:8090/v1 LLM_CACHE_ENABLED=false \
+        python -m bench.llm_bench --leads 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from prometheus_client import REGISTRY
+from lib import dossier
+from lib.llm import llm
+
+
+def _llm_stats() -> dict:
+    """Model calls, cache hits, retries and failures, read back from the Prometheus metrics."""
+    sample = lambda name, **labels: int(REGISTRY.get_sample_value(name, labels) or 0)
+    return {
+        "calls": sum(sample("edinburgh_llm_call_seconds_count", outcome=outcome) for outcome in ("ok", "error")),
+        "cache_hits": sample("edinburgh_llm_events_total", event="cache_hit"),
+        "retries": sample("edinburgh_llm_events_total", event="retry"),
+        "failures": sample("edinburgh_llm_events_total", event="failure"),
+    }
+
+
+def _lead(index: int) -> dict:
+    return {
+        "company_name": f"Company {index}",
+        "decision_maker_name": f"Person{index}",
+        "decision_maker_title": "Founder",
+        "website_content": f"Company {index} runs local SEO audits for dentists. " * 50,
+        "is_qualified": index % 2 == 0,
+    }
+
+
+async def run(leads: int):
+    latencies = []
+
+    async def one(index: int):
+        started = time.perf_counter()
+        await dossier.generateCustomEmail(_lead(index))
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(leads)))
+    elapsed = time.perf_counter() - started
+    await llm.close()
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"{leads} emails in {elapsed:.2f}s ({leads / elapsed:.1f}/s)")
+    print(f"p50 {quantiles[49]:.3f}s  p95 {quantiles[94]:.3f}s  p99 {quantiles[98]:.3f}s")
+    print(f"llm stats: {_llm_stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--leads", type=int, default=100)
+    asyncio.run(run(parser.parse_args().leads))
@@ -0,0 +1,372 @@
+"""
+Offline benchmark of the hot paths: /generate-email, /send-email and cron.main,
+against local stand-ins for everything the backend talks to.
+
+    pip install -r bench/requirements.txt                # from backend/, once
+    python -m bench.run                                  # all scenarios
+    python -m bench.run --scenario send --requests 500 --concurrency 16
+    python -m bench.run --compare bench/baselines/default.json
+    python -m bench.run --write-baseline bench/baselines/default.json
+
+The stand-ins are bench/sites (saved lead websites, served over HTTP),
+bench/smtp_sink.py, bench/fake_supabase.py, bench/stub_llm.py and, with
+--linkedin, bench/fake_apify.py. The API runs
+as `uvicorn main:app` in a subprocess pointed at them; cron.main runs in this
+process. The corpus is plain HTML, so the HTTP tier serves it and Chromium
+is never launched.
+
+Each scenario records p50/p95/p99 latency, throughput and peak RSS of the
+process under test to bench/results/latest.json. --compare exits with 1 when
+a scenario's p95 or RSS is more than BENCH_TOLERANCE above the baseline, its
+throughput that much below it, or it has more errors.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Awaitable, Callable, Dict, List, Optional
+import httpx
+import psutil
+from bench import fake_apify, fake_supabase, smtp_sink
+from bench.stub_llm import STUB_LLM_PORT
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+SITES_DIR = os.path.join(BENCH_DIR, "sites")
+RESULTS_PATH = os.path.join(BENCH_DIR, "results", "latest.json")
+
+# --- CONFIG ---
+BENCH_API_PORT = int(os.getenv("BENCH_API_PORT", "8095"))
+BENCH_SITE_PORT = int(os.getenv("BENCH_SITE_PORT", "8093"))
+# Relative slack before a difference from the baseline counts as a regression
+BENCH_TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "0.25"))
+BENCH_MAILBOXES = ["bench1@example.com", "bench2@example.com", "bench3@example.com"]
+SCENARIOS = ("generate", "send", "cron")
+
+
+def bench_env(scratch_dir: str, llm: bool, linkedin: bool = False) -> Dict[str, str]:
+    """Settings that point the backend at the stand-ins and keep it off real caches and journals."""
+    env = {
+        "SUPABASE_URL": f"http://127.0.0.1:{fake_supabase.FAKE_SUPABASE_PORT}",
+        "SUPABASE_KEY": "bench",
+        "SMTP_SERVER": "127.0.0.1",
+        "SMTP_PORT": str(smtp_sink.SMTP_SINK_PORT),
+        "SMTP_STARTTLS": "false",
+        "SENDER_EMAIL": BENCH_MAILBOXES[0],
+        "SENDER_PASSWORD": "bench",
+        "OPEN_AI_API_KEY": "bench",
+        "APIFY_TOKEN": "bench",
+        "APIFY_API_URL": f"http://127.0.0.1:{fake_apify.FAKE_APIFY_PORT}",
+        "LINKEDIN_ENABLED": "true" if linkedin else "false",
+        "LINKEDIN_CACHE_PATH": os.path.join(scratch_dir, "linkedin-cache.sqlite3"),
+        "LLM_ENABLED": "true" if llm else "false",
+        "LLM_BASE_URL": f"http://127.0.0.1:{STUB_LLM_PORT}/v1",
+        # Every request should do the full work, not hit a cache warmed by the previous one
+        "LLM_CACHE_ENABLED": "false",
+        "DOSSIER_CACHE_ENABLED": "false",
+        "SENT_JOURNAL_DIR": os.path.join(scratch_dir, "sent-journal"),
+        "JOB_QUEUE_PATH": os.path.join(scratch_dir, "jobs.sqlite3"),
+        # No pacing or caps: the benchmark measures the send path, not the throttle
+        "LANE_MIN_DELAY": "0",
+        "LANE_MAX_DELAY": "0",
+        "MAILBOX_HOURLY_CAP": "1000000",
+        "MAILBOX_DAILY_CAP": "1000000",
+    }
+    return {**os.environ, **env}
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    # Nearest rank, so p99 of 100 samples is the 99th sample rather than an interpolation
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+class RSSSampler:
+    """Peak resident memory of one process, sampled on a background thread."""
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.peak = max(self.peak, self.process.memory_info().rss)
+            except psutil.Error:
+                return
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    @property
+    def peak_mb(self) -> float:
+        return round(self.peak / (1024 * 1024), 1)
+
+
+def summarize(latencies: List[float], errors: int, seconds: float, units: int, concurrency: int, rss: RSSSampler) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "throughput_per_s": round(units / seconds, 2) if seconds else 0.0,
+        "p50_ms": round(_percentile(ordered, 50) * 1000, 1),
+        "p95_ms": round(_percentile(ordered, 95) * 1000, 1),
+        "p99_ms": round(_percentile(ordered, 99) * 1000, 1),
+        "rss_mb_peak": rss.peak_mb,
+    }
+
+
+async def drive(call: Callable[[int], Awaitable[bool]], total: int, concurrency: int, warmup: int = 0):
+    """
+    Runs `call(0..total-1)` with at most `concurrency` in flight; returns latencies, errors and wall time.
+    The first `warmup` calls run beforehand and are not recorded (connection pools, tokenizer, imports).
+    """
+    await asyncio.gather(*(call(index) for index in range(warmup)), return_exceptions=True)
+    latencies: List[float] = []
+    errors = 0
+    indexes = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for index in indexes:
+            started = time.perf_counter()
+            try:
+                ok = await call(index)
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            errors += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def start_site_server(port: int = BENCH_SITE_PORT) -> ThreadingHTTPServer:
+    class QuietHandler(SimpleHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), partial(QuietHandler, directory=SITES_DIR))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_process(args: List[str], env: Dict[str, str], ready_url: str, timeout: float = 60) -> subprocess.Popen:
+    process = subprocess.Popen([sys.executable, *args], cwd=BACKEND_DIR, env=env)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(args)} exited with {process.returncode} during startup")
+        try:
+            httpx.get(ready_url, timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.25)
+    process.terminate()
+    raise RuntimeError(f"{' '.join(args)} not ready after {timeout}s")
+
+
+def stop_process(process: Optional[subprocess.Popen]):
+    if process and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def lead_sites() -> List[str]:
+    return sorted(name for name in os.listdir(SITES_DIR) if os.path.isdir(os.path.join(SITES_DIR, name)))
+
+
+async def bench_generate(api: str, pid: int, requests: int, concurrency: int, warmup: int, linkedin: bool = False) -> dict:
+    sites = lead_sites()
+
+    async with httpx.AsyncClient(base_url=api, timeout=120) as client:
+        async def call(index: int) -> bool:
+            site = sites[index % len(sites)]
+            response = await client.post("/generate-email", json={
+                "company_name": site.replace("-", " ").title(),
+                "decision_maker_name": f"Lead{index}",
+                "decision_maker_title": "Owner",
+                "linkedin_url": f"https://www.linkedin.com/in/{site}-owner/" if linkedin else "",
+                "website_url": f"http://127.0.0.1:{BENCH_SITE_PORT}/{site}/index.html",
+            })
+            return response.status_code == 200
+
+        with RSSSampler(pid) as rss:
+            latencies, errors, seconds = await drive(call, requests, concurrency, warmup)
+    return summarize(latencies, errors, seconds, requests, concurrency, rss)
+
+
+async def bench_send(api: str, pid: int, requests: int, concurrency: int, warmup: int) -> dict:
+    async with httpx.AsyncClient(base_url=api, timeout=60) as client:
+        async def call(index: int) -> bool:
+            response = await client.post("/send-email", json={
+                "recipient": f"lead{index}@example.com",
+                "subject": f"Quick question {index}",
+                "body_text": f"Hey Lead{index},\n\nSo am not sure if this will work for you but I figured I'd reach out anyway.\n\nPetrus",
+                "sender_name": "Petrus",
+            })
+            return response.status_code == 200
+
+        with RSSSampler(pid) as rss:
+            latencies, errors, seconds = await drive(call, requests, concurrency, warmup)
+    return summarize(latencies, errors, seconds, requests, concurrency, rss)
+
+
+async def bench_cron(sink_stats: Dict[str, int], rows: int, runs: int) -> dict:
+    """
+    `runs` cron.main calls, each with `rows` emails due now; throughput is emails sent per second.
+    A run claims and sends CLAIM_BATCH_SIZE rows at a time until none are due, as in production.
+    """
+    # Imported here so the bench settings are in the environment before lib reads its config
+    from lib import cron
+
+    sink_before = sink_stats["messages"]
+    latencies, errors = [], 0
+    with RSSSampler(os.getpid()) as rss:
+        started = time.perf_counter()
+        for _ in range(runs):
+            fake_supabase.reset()
+            fake_supabase.seed_scheduled(rows, BENCH_MAILBOXES)
+            run_started = time.perf_counter()
+            summary = await asyncio.to_thread(cron.main)
+            latencies.append(time.perf_counter() - run_started)
+            errors += summary.failed + summary.deferred
+        seconds = time.perf_counter() - started
+    sent = sink_stats["messages"] - sink_before
+    result = summarize(latencies, errors, seconds, sent, 1, rss)
+    result["emails_sent"] = sent
+    return result
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float = BENCH_TOLERANCE) -> List[str]:
+    """Human-readable regressions of `results` against `baseline`; empty when there are none."""
+    regressions = []
+    for name, base in baseline.items():
+        current = results.get(name)
+        if not current or "error" in current or "error" in base:
+            continue
+        if current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+        if current["throughput_per_s"] < base["throughput_per_s"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {current['throughput_per_s']}/s vs baseline {base['throughput_per_s']}/s")
+        if current["rss_mb_peak"] > base["rss_mb_peak"] * (1 + tolerance):
+            regressions.append(f"{name}: peak RSS {current['rss_mb_peak']}MB vs baseline {base['rss_mb_peak']}MB")
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{name}: {current['errors']} errors vs baseline {base['errors']}")
+    return regressions
+
+
+async def run(args) -> Dict[str, dict]:
+    results: Dict[str, dict] = {}
+    scratch = tempfile.TemporaryDirectory(prefix="edinburgh-bench-")
+    env = bench_env(scratch.name, llm=not args.no_llm, linkedin=args.linkedin)
+    # cron.main runs in this process, so it needs the same settings
+    os.environ.update(env)
+
+    sites = start_site_server()
+    sink = smtp_sink.start()
+    supabase = fake_supabase.start()
+    apify = fake_apify.start() if args.linkedin else None
+    stub_llm = api = None
+    try:
+        if "generate" in args.scenario and not args.no_llm:
+            llm_env = {**env, "STUB_LLM_LATENCY_MS": str(args.llm_latency_ms), "STUB_LLM_JITTER_MS": str(args.llm_latency_ms / 4)}
+            stub_llm = start_process(["-m", "bench.stub_llm"], llm_env, f"http://127.0.0.1:{STUB_LLM_PORT}/stats")
+        if {"generate", "send"} & set(args.scenario):
+            api = start_process(
+                ["-m", "uvicorn", "main:app", "--port", str(BENCH_API_PORT), "--log-level", "warning"],
+                env,
+                f"http://127.0.0.1:{BENCH_API_PORT}/metrics",
+                timeout=120,
+            )
+        api_url = f"http://127.0.0.1:{BENCH_API_PORT}"
+        for name in args.scenario:
+            print(f"[*] Running {name}...")
+            try:
+                if name == "generate":
+                    results[name] = await bench_generate(api_url, api.pid, args.requests, args.concurrency, args.warmup, args.linkedin)
+                elif name == "send":
+                    results[name] = await bench_send(api_url, api.pid, args.requests, args.concurrency, args.warmup)
+                else:
+                    results[name] = await bench_cron(sink.handler.stats, args.cron_rows, args.cron_runs)
+            except Exception as e:
+                results[name] = {"error": str(e)}
+            print(f"    {json.dumps(results[name])}")
+    finally:
+        stop_process(api)
+        stop_process(stub_llm)
+        supabase.should_exit = True
+        if apify:
+            apify.should_exit = True
+        sink.stop()
+        sites.shutdown()
+        scratch.cleanup()
+    return results
+
+
+def write_json(path: str, results: Dict[str, dict]):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    document = {
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs",
+        "scenarios": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+        f.write("\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark generate, send and the send cron against local stand-ins.")
+    parser.add_argument("--scenario", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="requests per API scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="API requests in flight at once")
+    parser.add_argument("--warmup", type=int, default=8, help="unrecorded requests before each API scenario")
+    parser.add_argument("--cron-rows", type=int, default=100, help="emails due in each cron run")
+    parser.add_argument("--cron-runs", type=int, default=5)
+    parser.add_argument("--no-llm", action="store_true", help="generate from templates instead of the stub LLM")
+    parser.add_argument("--llm-latency-ms", type=float, default=200)
+    parser.add_argument("--linkedin", action="store_true", help="enrich generate requests with posts from the fake Apify")
+    parser.add_argument("--output", default=RESULTS_PATH)
+    parser.add_argument("--compare", metavar="BASELINE", help="exit with 1 on a regression against this baseline")
+    parser.add_argument("--write-baseline", metavar="BASELINE", help="also save the results as this baseline")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    write_json(args.output, results)
+    if args.write_baseline:
+        write_json(args.write_baseline, results)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f)["scenarios"])
+        for regression in regressions:
+            print(f"❌ {regression}")
+        if regressions:
+            sys.exit(1)
+        print("✅ No regressions against the baseline")
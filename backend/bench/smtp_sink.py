@@ -0,0 +1,64 @@
+"""
+Local SMTP server that accepts any login and throws the mail away, for
+timing the send path without Hostinger.
+
+    python -m bench.smtp_sink           # from backend/, listens on :8025
+    SMTP_SERVER=127.0.0.1 SMTP_PORT=8025 SMTP_STARTTLS=false uvicorn main:app
+
+SMTP_SINK_LATENCY_MS delays every DATA reply, roughly what a remote server
+spends queueing the message.
+"""
+import asyncio
+import os
+import time
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+SMTP_SINK_PORT = int(os.getenv("SMTP_SINK_PORT", "8025"))
+SMTP_SINK_LATENCY_MS = float(os.getenv("SMTP_SINK_LATENCY_MS", "0"))
+
+
+class SinkHandler:
+    def __init__(self, latency_ms: float = SMTP_SINK_LATENCY_MS):
+        self.latency_ms = latency_ms
+        self.stats = {"messages": 0, "bytes": 0, "logins": 0}
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        self.stats["messages"] += 1
+        self.stats["bytes"] += len(envelope.original_content or b"")
+        return "250 Message accepted for delivery"
+
+
+def _accept_any_login(handler: SinkHandler):
+    def authenticator(server, session, envelope, mechanism, auth_data):
+        handler.stats["logins"] += 1
+        return AuthResult(success=True)
+    return authenticator
+
+
+def start(port: int = SMTP_SINK_PORT, latency_ms: float = SMTP_SINK_LATENCY_MS) -> Controller:
+    """Runs the sink on its own thread; stop it with controller.stop()."""
+    handler = SinkHandler(latency_ms)
+    controller = Controller(
+        handler,
+        hostname="127.0.0.1",
+        port=port,
+        authenticator=_accept_any_login(handler),
+        # Plain-text AUTH is fine on loopback; the client skips STARTTLS via SMTP_STARTTLS=false
+        auth_require_tls=False,
+    )
+    controller.start()
+    return controller
+
+
+if __name__ == "__main__":
+    controller = start()
+    print(f"SMTP sink listening on 127.0.0.1:{SMTP_SINK_PORT}")
+    try:
+        while True:
+            time.sleep(10)
+            print(controller.handler.stats)
+    except KeyboardInterrupt:
+        controller.stop()
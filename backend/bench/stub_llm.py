@@ -0,0 +1,94 @@
+"""
+Stand-in for the OpenAI Responses API, for running email generation offline.
+
+    python -m bench.stub_llm            # from backend/, listens on :8090
+    LLM_ENABLED=true LLM_BASE_URL=http://localhost:8090/v1 uvicorn main:app
+
+Latency and failure rate are configurable so retries and the concurrency
+limit can be exercised: STUB_LLM_LATENCY_MS, STUB_LLM_JITTER_MS and
+STUB_LLM_ERROR_RATE (share of requests answered with a 429 or 503).
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import time
+import uuid
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+STUB_LLM_PORT = int(os.getenv("STUB_LLM_PORT", "8090"))
+STUB_LLM_LATENCY_MS = float(os.getenv("STUB_LLM_LATENCY_MS", "800"))
+STUB_LLM_JITTER_MS = float(os.getenv("STUB_LLM_JITTER_MS", "400"))
+STUB_LLM_ERROR_RATE = float(os.getenv("STUB_LLM_ERROR_RATE", "0"))
+
+app = FastAPI()
+stats = {"requests": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0}
+
+
+def _fake_email(prompt: str) -> dict:
+    company = re.search(r"business called (.+?)\.\n", prompt)
+    name = re.search(r"decision maker is (\S+)", prompt)
+    company = company.group(1) if company else "your company"
+    name = name.group(1) if name else "there"
+    return {
+        "body": f"Hey {name},\n\nSo am not sure if this will work for {company} but I figured I'd reach out anyway.\n\nPetrus",
+        "subject": f"Could this work for you too {name}?",
+    }
+
+
+@app.post("/v1/responses")
+async def responses(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    stats["in_flight"] += 1
+    stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+    try:
+        await asyncio.sleep(max(0, STUB_LLM_LATENCY_MS + random.uniform(-1, 1) * STUB_LLM_JITTER_MS) / 1000)
+        if random.random() < STUB_LLM_ERROR_RATE:
+            stats["errors"] += 1
+            status = random.choice((429, 503))
+            return JSONResponse(
+                {"error": {"message": "stubbed failure", "type": "server_error", "code": None}},
+                status_code=status,
+                headers={"retry-after": "0.2"} if status == 429 else {},
+            )
+        prompt = " ".join(message["content"] for message in body["input"] if message["role"] == "user")
+        text = json.dumps(_fake_email(prompt))
+        return {
+            "id": f"resp_{uuid.uuid4().hex}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": body["model"],
+            "status": "completed",
+            "output": [{
+                "type": "message",
+                "id": f"msg_{uuid.uuid4().hex}",
+                "status": "completed",
+                "role": "assistant",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }],
+            "parallel_tool_calls": False,
+            "tool_choice": "auto",
+            "tools": [],
+            "usage": {
+                "input_tokens": len(prompt) // 4,
+                "input_tokens_details": {"cached_tokens": 0},
+                "output_tokens": len(text) // 4,
+                "output_tokens_details": {"reasoning_tokens": 0},
+                "total_tokens": (len(prompt) + len(text)) // 4,
+            },
+        }
+    finally:
+        stats["in_flight"] -= 1
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=STUB_LLM_PORT, log_level="warning")
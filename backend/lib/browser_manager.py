@@ -0,0 +1,195 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from playwright.async_api import Browser, Playwright
+from dotenv import load_dotenv
+from lib.browser_pool import BrowserPool, BrowserPoolSaturated, BROWSER_POOL_SIZE
+
+try:
+    import psutil
+except ImportError:  # RSS is then reported as None and the memory limit is not enforced
+    psutil = None
+
+load_dotenv()
+
+# --- CONFIG ---
+# Chromium instances to shard pages across; each gets its own BrowserPool
+BROWSER_COUNT = int(os.getenv("BROWSER_COUNT", "2"))
+# A browser is drained and relaunched after serving this many pages...
+BROWSER_MAX_PAGES = int(os.getenv("BROWSER_MAX_PAGES", "500"))
+# ...or once Chromium (all of its processes) uses more than this much memory...
+BROWSER_MAX_RSS_MB = float(os.getenv("BROWSER_MAX_RSS_MB", "1500"))
+# ...or when this share of its last BROWSER_ERROR_WINDOW pages failed
+BROWSER_MAX_ERROR_RATE = float(os.getenv("BROWSER_MAX_ERROR_RATE", "0.8"))
+BROWSER_ERROR_WINDOW = int(os.getenv("BROWSER_ERROR_WINDOW", "20"))
+BROWSER_HEALTH_INTERVAL = float(os.getenv("BROWSER_HEALTH_INTERVAL", "30"))
+
+
+class ManagedBrowser:
+    def __init__(self, index: int):
+        self.index = index
+        self.browser: Optional[Browser] = None
+        self.pool: Optional[BrowserPool] = None
+        # Passed to Chromium as a no-op switch so its processes can be found for RSS
+        self.tag = f"--edinburgh-browser={uuid.uuid4().hex}"
+        self.pages_served = 0
+        self.outcomes: deque = deque(maxlen=BROWSER_ERROR_WINDOW)
+        self.draining = False
+        self.started_at = time.time()
+        self.last_rss_mb: Optional[float] = None
+
+    @property
+    def load(self) -> int:
+        stats = self.pool.stats()
+        return stats["in_use"] + stats["waiting"]
+
+    def error_rate(self) -> float:
+        if len(self.outcomes) < BROWSER_ERROR_WINDOW:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def rss_mb(self) -> Optional[float]:
+        if psutil is None:
+            return None
+        total = 0
+        for process in psutil.process_iter(["cmdline"]):
+            try:
+                if self.tag in (process.info["cmdline"] or []):
+                    total += process.memory_info().rss
+                    total += sum(child.memory_info().rss for child in process.children(recursive=True))
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return round(total / (1024 * 1024), 1)
+
+    def restart_reason(self) -> Optional[str]:
+        if self.browser is None or not self.browser.is_connected():
+            return "disconnected"
+        if self.pages_served >= BROWSER_MAX_PAGES:
+            return f"served {self.pages_served} pages"
+        if self.error_rate() >= BROWSER_MAX_ERROR_RATE:
+            return f"error rate {self.error_rate():.0%}"
+        return None
+
+
+class BrowserManager:
+    """
+    Runs several Chromium instances and hands each page to the least loaded one.
+    Browsers that crash, leak memory, serve too many pages or keep failing are
+    drained and relaunched in the background while the others keep serving.
+    Exposes the same checkout()/stats()/close() surface as BrowserPool.
+    """
+
+    def __init__(self, playwright: Playwright, count: int = BROWSER_COUNT, pool_size: int = BROWSER_POOL_SIZE):
+        self.playwright = playwright
+        self.pool_size = pool_size
+        self.browsers: List[ManagedBrowser] = [ManagedBrowser(index) for index in range(count)]
+        self._health_task: Optional[asyncio.Task] = None
+
+    async def _launch(self, managed: ManagedBrowser):
+        managed.browser = await self.playwright.chromium.launch(headless=True, timeout=60000, args=[managed.tag])
+        managed.pool = BrowserPool(managed.browser, size=self.pool_size)
+        await managed.pool.start()
+        managed.pages_served = 0
+        managed.outcomes.clear()
+        managed.started_at = time.time()
+        managed.draining = False
+        print(f"Browser {managed.index} started.")
+
+    async def start(self):
+        results = await asyncio.gather(*(self._launch(managed) for managed in self.browsers), return_exceptions=True)
+        for managed, result in zip(self.browsers, results):
+            if isinstance(result, Exception):
+                # The health loop keeps retrying it
+                print(f"Could not start browser {managed.index}: {result}")
+        self._health_task = asyncio.create_task(self._health_loop())
+
+    def _pick(self) -> ManagedBrowser:
+        candidates = [m for m in self.browsers if not m.draining and m.pool is not None]
+        if not candidates:
+            raise BrowserPoolSaturated("No healthy browser available")
+        return min(candidates, key=lambda m: m.load)
+
+    async def _restart(self, managed: ManagedBrowser, reason: str):
+        if managed.draining:
+            return
+        managed.draining = True
+        print(f"Restarting browser {managed.index}: {reason}")
+        # Let pages in flight and already queued finish (bounded by their own scrape timeouts)
+        while managed.load and managed.browser.is_connected():
+            await asyncio.sleep(0.5)
+        try:
+            await managed.pool.close()
+            await managed.browser.close()
+        except Exception as e:
+            print(f"Error closing browser {managed.index}: {e}")
+        try:
+            await self._launch(managed)
+        except Exception as e:
+            # Out of rotation until the health loop manages to relaunch it
+            print(f"Could not relaunch browser {managed.index}: {e}")
+            managed.browser = None
+            managed.pool = None
+            managed.draining = False
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(BROWSER_HEALTH_INTERVAL)
+            for managed in self.browsers:
+                if managed.browser is None and not managed.draining:
+                    managed.draining = True
+                    try:
+                        await self._launch(managed)
+                    except Exception as e:
+                        print(f"Could not relaunch browser {managed.index}: {e}")
+                        managed.draining = False
+                    continue
+                # psutil walks the process table, keep it off the event loop
+                rss = managed.last_rss_mb = await asyncio.to_thread(managed.rss_mb)
+                reason = managed.restart_reason() or (
+                    f"using {rss} MB" if rss is not None and rss > BROWSER_MAX_RSS_MB else None
+                )
+                if reason and not managed.draining:
+                    asyncio.create_task(self._restart(managed, reason))
+
+    @asynccontextmanager
+    async def checkout(self):
+        managed = self._pick()
+        ok = False
+        try:
+            async with managed.pool.checkout() as context:
+                yield context
+            ok = True
+        finally:
+            managed.pages_served += 1
+            managed.outcomes.append(ok)
+            reason = managed.restart_reason()
+            if reason and not managed.draining:
+                asyncio.create_task(self._restart(managed, reason))
+
+    def stats(self) -> dict:
+        browsers = []
+        for managed in self.browsers:
+            browsers.append({
+                "index": managed.index,
+                "connected": bool(managed.browser and managed.browser.is_connected()),
+                "draining": managed.draining,
+                "pages_served": managed.pages_served,
+                "error_rate": round(managed.error_rate(), 2),
+                "rss_mb": managed.last_rss_mb,
+                "uptime_seconds": round(time.time() - managed.started_at),
+                "pool": managed.pool.stats() if managed.pool else None,
+            })
+        return {"browsers": browsers}
+
+    async def close(self):
+        if self._health_task:
+            self._health_task.cancel()
+        for managed in self.browsers:
+            if managed.pool:
+                await managed.pool.close()
+            if managed.browser:
+                await managed.browser.close()
@@ -0,0 +1,120 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+from playwright.async_api import Browser, BrowserContext
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- CONFIG ---
+# Number of warm contexts, i.e. how many pages may be scraping at once
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "4"))
+# A context is thrown away and rebuilt after this many pages to cap Chromium memory growth
+BROWSER_PAGES_PER_CONTEXT = int(os.getenv("BROWSER_PAGES_PER_CONTEXT", "25"))
+# Requests allowed to queue for a context before new ones are turned away
+BROWSER_POOL_MAX_WAITING = int(os.getenv("BROWSER_POOL_MAX_WAITING", "32"))
+BROWSER_POOL_ACQUIRE_TIMEOUT = float(os.getenv("BROWSER_POOL_ACQUIRE_TIMEOUT", "60"))
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/140.0.0.0 Safari/537.36'
+
+
+class BrowserPoolSaturated(Exception):
+    """Raised when the wait queue is full or no context frees up in time."""
+
+
+class _PooledContext:
+    def __init__(self):
+        self.context: Optional[BrowserContext] = None
+        self.pages_served = 0
+
+
+class BrowserPool:
+    """
+    Bounded pool of pre-warmed browser contexts on one shared browser. Each
+    context serves one page at a time, so the pool size is the scrape
+    concurrency; callers beyond that queue up to `max_waiting` deep.
+    """
+
+    def __init__(
+        self,
+        browser: Browser,
+        size: int = BROWSER_POOL_SIZE,
+        pages_per_context: int = BROWSER_PAGES_PER_CONTEXT,
+        max_waiting: int = BROWSER_POOL_MAX_WAITING,
+        acquire_timeout: float = BROWSER_POOL_ACQUIRE_TIMEOUT,
+    ):
+        self.browser = browser
+        self.size = size
+        self.pages_per_context = pages_per_context
+        self.max_waiting = max_waiting
+        self.acquire_timeout = acquire_timeout
+        self.waiting = 0
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._slots = [_PooledContext() for _ in range(size)]
+
+    async def _new_context(self) -> BrowserContext:
+        return await self.browser.new_context(user_agent=USER_AGENT)
+
+    async def start(self):
+        """Warms up every context so the first requests don't pay for it."""
+        for slot in self._slots:
+            try:
+                slot.context = await self._new_context()
+            except Exception as e:
+                # Created lazily on first checkout instead
+                print(f"Could not pre-warm browser context: {e}")
+            self._idle.put_nowait(slot)
+
+    async def _recycle(self, slot: _PooledContext):
+        if slot.context is not None:
+            try:
+                await slot.context.close()
+            except Exception as e:
+                print(f"Error closing browser context: {e}")
+        slot.context = None
+        slot.pages_served = 0
+        try:
+            slot.context = await self._new_context()
+        except Exception as e:
+            print(f"Could not recreate browser context: {e}")
+
+    @asynccontextmanager
+    async def checkout(self):
+        """Borrow a whole context (for multi-page work); it is returned on exit."""
+        if self.waiting >= self.max_waiting:
+            raise BrowserPoolSaturated("Too many scrape requests queued")
+        self.waiting += 1
+        try:
+            slot = await asyncio.wait_for(self._idle.get(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise BrowserPoolSaturated("Timed out waiting for a browser context")
+        finally:
+            self.waiting -= 1
+
+        healthy = True
+        try:
+            if slot.context is None:
+                slot.context = await self._new_context()
+            yield slot.context
+        except Exception:
+            healthy = False
+            raise
+        finally:
+            slot.pages_served += 1
+            if not healthy or slot.pages_served >= self.pages_per_context:
+                await self._recycle(slot)
+            self._idle.put_nowait(slot)
+
+    def stats(self) -> dict:
+        idle = self._idle.qsize()
+        return {"size": self.size, "idle": idle, "in_use": self.size - idle, "waiting": self.waiting}
+
+    async def close(self):
+        for slot in self._slots:
+            if slot.context is not None:
+                try:
+                    await slot.context.close()
+                except Exception:
+                    pass
+                slot.context = None
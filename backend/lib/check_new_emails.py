@@ -1,10 +1,14 @@
-
 import os
 from dotenv import load_dotenv
-from typing import List, Optional
-from playwright.async_api import async_playwright, Browser, Playwright
-import re
-import requests
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+import argparse
+import imaplib
+import random
+import select
+import ssl
+import threading
+import httpx
 import asyncio
 import sys
 load_dotenv()
@@ -12,8 +16,6 @@ load_dotenv()
 if sys.platform == "win32":
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
-playwright_instance: Optional[Playwright] = None
-browser_instance: Optional[Browser] = None
 WEBHOOK_URL = os.getenv("WEBHOOK_URL_FOR_EMAIL_NOTIFY")
 EMAIL_PASSWORD = os.getenv("SENDER_PASSWORD")
 SENDER_EMAIL_1 = os.getenv("SENDER_EMAIL_1")
@@ -21,59 +23,211 @@ SENDER_EMAIL_2 = os.getenv("SENDER_EMAIL_2")
 SENDER_EMAIL_3 = os.getenv("SENDER_EMAIL_3")
 all_senders = [SENDER_EMAIL_1, SENDER_EMAIL_2, SENDER_EMAIL_3]
 
-async def check_new_emails(email: str, password: str) -> List[str]:
-    global playwright_instance, browser_instance
-    if playwright_instance is None or browser_instance is None:
-        playwright_instance = await async_playwright().start()
-        browser_instance = await playwright_instance.chromium.launch(headless=False)
-        print(f"Playwright browser for email checking started for: {email}.")
-    user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/140.0.0.0 Safari/537.36'
-    viewport = {'width': 1920, 'height': 1080}
-    storage_state = None 
-    context = await browser_instance.new_context(
-            user_agent=user_agent,
-            viewport=viewport,
-    )
-    
-    page = await context.new_page()
-    
+# --- IMAP CONFIG ---
+IMAP_SERVER = os.getenv("IMAP_SERVER", "imap.hostinger.com")
+IMAP_PORT = int(os.getenv("IMAP_PORT", "993"))
+IMAP_SSL = os.getenv("IMAP_SSL", "true").lower() == "true"
+IMAP_TIMEOUT = float(os.getenv("IMAP_TIMEOUT", "30"))
+# Servers drop IDLE after 30 min (RFC 2177), so it is re-issued before that
+IMAP_IDLE_SECONDS = float(os.getenv("IMAP_IDLE_SECONDS", str(25 * 60)))
+IMAP_RECONNECT_MAX = float(os.getenv("IMAP_RECONNECT_MAX", "300"))
+
+
+class InboxCounts(BaseModel):
+    unread: int
+    replies: int  # unread messages that answer one of ours (have In-Reply-To)
+
+
+class InboxSession:
+    """
+    One logged-in IMAP connection with INBOX selected read-only, so counting
+    never marks anything as seen. Blocking; each session runs in its own thread.
+    """
+
+    def __init__(self, email: str, password: str):
+        self.email = email
+        imap_class = imaplib.IMAP4_SSL if IMAP_SSL else imaplib.IMAP4
+        self.imap = imap_class(IMAP_SERVER, IMAP_PORT, timeout=IMAP_TIMEOUT)
+        self.imap.login(email, password)
+        self.imap.select("INBOX", readonly=True)
+        self.stopped = threading.Event()
+        # close() from another thread waits for a running IDLE to end instead of interleaving with it
+        self._lock = threading.Lock()
+
+    def _search(self, *criteria: str) -> int:
+        status, data = self.imap.uid("SEARCH", *criteria)
+        if status != "OK":
+            raise imaplib.IMAP4.error(f"SEARCH failed: {data}")
+        return len(data[0].split()) if data and data[0] else 0
+
+    def counts(self) -> InboxCounts:
+        with self._lock:
+            # NOOP lets the server report mail that arrived since the last command
+            self.imap.noop()
+            return InboxCounts(unread=self._search("UNSEEN"), replies=self._search("UNSEEN", "HEADER", "In-Reply-To", '""'))
+
+    def idle(self, timeout: float = IMAP_IDLE_SECONDS) -> bool:
+        """Waits in IDLE until the server pushes a change (True), the timeout passes or stop() is called."""
+        with self._lock:
+            tag = self.imap._new_tag()
+            self.imap.send(tag + b" IDLE\r\n")
+            response = self.imap.readline()
+            if not response.startswith(b"+"):
+                raise imaplib.IMAP4.abort(f"IDLE refused: {response!r}")
+            changed = False
+            deadline = timeout
+            sock = self.imap.sock
+            # select() instead of a socket timeout: a timed-out read leaves imaplib's file object unusable
+            while deadline > 0 and not self.stopped.is_set():
+                if self._buffered() or select.select([sock], [], [], min(deadline, 5))[0]:
+                    line = self.imap.readline()
+                    if not line:
+                        raise imaplib.IMAP4.abort("Connection closed during IDLE")
+                    if line.startswith(b"*") and (b"EXISTS" in line or b"EXPUNGE" in line or b"FETCH" in line):
+                        changed = True
+                        break
+                else:
+                    deadline -= 5
+            self.imap.send(b"DONE\r\n")
+            while True:
+                line = self.imap.readline()
+                if not line:
+                    raise imaplib.IMAP4.abort("Connection closed ending IDLE")
+                if line.startswith(tag):
+                    break
+            return changed
+
+    def _buffered(self) -> bool:
+        """
+        Whether a line can be read without waiting. select() only sees the socket,
+        not what imaplib's file object (or TLS) has already read past the last line,
+        e.g. an EXISTS that arrived in the same packet as the IDLE continuation.
+        """
+        sock = self.imap.sock
+        timeout = sock.gettimeout()
+        sock.settimeout(0)
+        try:
+            # With the socket non-blocking, peek() returns what is buffered or readable right now
+            return bool(self.imap.file.peek(1))
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return False
+        finally:
+            sock.settimeout(timeout)
+
+    def stop(self):
+        self.stopped.set()
+
+    def close(self):
+        self.stopped.set()
+        with self._lock:
+            try:
+                self.imap.logout()
+            except (imaplib.IMAP4.error, OSError):
+                pass
+
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """One keep-alive client for every webhook call."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(timeout=10)
+    return _http_client
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+async def notify(email: str, counts: InboxCounts):
+    if not WEBHOOK_URL:
+        return
+    data = {"email": f"from: {email} count:{counts.unread}", "mailbox": email, **counts.model_dump()}
     try:
-        await page.goto("https://mail.hostinger.com/")
-        print("Navigated to email client webapp.")
-
-        
-        # Login
-        await page.fill('input#rcmloginuser', email)
-        await page.wait_for_timeout(4000)  # wait for 2 seconds
-        await page.fill('input#rcmloginpwd', password)
-        await page.click('button#rcmloginsubmit')
-        
-        # Wait for inbox to load
-        await page.wait_for_selector('div#taskmenu', timeout=150000)
-        await page.wait_for_selector('a[rel="INBOX"]', timeout=150000)
-        #Wait for new message counter number
-        new_messages_count= await page.wait_for_selector('a[rel="INBOX"] > span', timeout=15000)
-        if new_messages_count:
-            print(f"New messages count: {await new_messages_count.text_content()}")
-            new_emails = await new_messages_count.text_content()
-            data = {"email": f"from: {email} count:{new_emails}"}
-            response = requests.post(WEBHOOK_URL, json=data)
-            if response.status_code == 200:
-                print("Data sent successfully.")
-            else:
-                print(f"Failed to send data. Status code: {response.status_code}")
+        response = await get_http_client().post(WEBHOOK_URL, json=data)
+        if response.status_code == 200:
+            print(f"Data sent successfully for {email}.")
         else:
-          print("No new messages found.")  
-    except Exception as e:
-        print(f"Error checking emails: {e}")
-        return []
+            print(f"Failed to send data for {email}. Status code: {response.status_code}")
+    except httpx.HTTPError as e:
+        print(f"Failed to send data for {email}: {e}")
+
+def _check_blocking(email: str, password: str) -> InboxCounts:
+    session = InboxSession(email, password)
+    try:
+        return session.counts()
+    finally:
+        session.close()
+
+async def check_new_emails(email: str, password: str) -> Optional[InboxCounts]:
+    """One-off unread/reply count for a mailbox, posted to the webhook when there is unread mail."""
+    try:
+        counts = await asyncio.to_thread(_check_blocking, email, password)
+    except (imaplib.IMAP4.error, OSError) as e:
+        print(f"Error checking emails for {email}: {e}")
+        return None
+    print(f"{email}: {counts.unread} unread, {counts.replies} replies")
+    if counts.unread:
+        await notify(email, counts)
+    else:
+        print(f"No new messages found for {email}.")
+    return counts
+
+async def check_all_mailboxes(senders: List[str] = all_senders, password: str = EMAIL_PASSWORD) -> Dict[str, Optional[InboxCounts]]:
+    """Checks every mailbox at once; the slowest server sets the total time."""
+    senders = [sender for sender in senders if sender]
+    results = await asyncio.gather(*(check_new_emails(sender, password) for sender in senders))
+    return dict(zip(senders, results))
+
+async def watch_mailbox(email: str, password: str):
+    """
+    Keeps one IDLE connection open and notifies whenever the counts change.
+    Reconnects with backoff when the connection drops.
+    """
+    last: Optional[InboxCounts] = None
+    failures = 0
+    while True:
+        session = None
+        try:
+            session = await asyncio.to_thread(InboxSession, email, password)
+            print(f"Watching {email} over IMAP IDLE.")
+            failures = 0
+            while True:
+                counts = await asyncio.to_thread(session.counts)
+                if counts != last:
+                    print(f"{email}: {counts.unread} unread, {counts.replies} replies")
+                    if counts.unread:
+                        await notify(email, counts)
+                    last = counts
+                await asyncio.to_thread(session.idle)
+        except (imaplib.IMAP4.error, OSError) as e:
+            failures += 1
+            delay = min(IMAP_RECONNECT_MAX, 2 ** failures) * random.uniform(0.5, 1)
+            print(f"IMAP connection for {email} failed ({e}), reconnecting in {delay:.0f}s")
+            await asyncio.sleep(delay)
+        finally:
+            if session:
+                # Also wakes a still-running IDLE thread when this task is cancelled
+                await asyncio.to_thread(session.close)
+
+async def watch_all_mailboxes(senders: List[str] = all_senders, password: str = EMAIL_PASSWORD):
+    try:
+        await asyncio.gather(*(watch_mailbox(sender, password) for sender in senders if sender))
+    finally:
+        await close_http_client()
+
+async def main(watch: bool = False):
+    if watch:
+        await watch_all_mailboxes()
+        return
+    try:
+        await check_all_mailboxes()
     finally:
-        await context.close()
+        await close_http_client()
 
 if __name__ == "__main__":
-    for sender in all_senders:
-        if sender:
-            asyncio.run(
-                check_new_emails(sender, os.getenv("SENDER_PASSWORD"))
-            )
-# --- IGNORE ---
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Count unread mail and replies in every sender inbox.")
+    parser.add_argument("--watch", action="store_true", help="stay connected and notify on every change (IMAP IDLE)")
+    asyncio.run(main(parser.parse_args().watch))
@@ -0,0 +1,118 @@
+"""
+Clients shared by the API, the worker and the send cron. Importing this
+module creates nothing: each getter builds its client on first use and hands
+the same instance to every later caller, so a process only pays for (and
+holds memory for) the clients it actually uses.
+"""
+import asyncio
+import os
+import threading
+from typing import TYPE_CHECKING, Optional
+from pydantic import BaseModel
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    from apify_client import ApifyClientAsync
+    from playwright.async_api import Playwright
+    from supabase import Client
+    from lib.browser_manager import BrowserManager
+
+load_dotenv()
+
+# --- CONFIG ---
+# Launch Chromium when the API or worker starts instead of on the first scrape
+# the plain HTTP tier can't serve; trades boot time and idle memory for a faster first scrape
+BROWSER_PRELAUNCH = os.getenv("BROWSER_PRELAUNCH", "false").lower() == "true"
+
+BANNER = "\033[1;32;40mA PENDORIAN PRODUCTION\033[0m"
+
+
+class Settings(BaseModel):
+    """Credentials the clients are built from."""
+    supabase_url: Optional[str] = None
+    supabase_key: Optional[str] = None
+    openai_api_key: Optional[str] = None
+    apify_token: Optional[str] = None
+    # Unset for api.apify.com; bench/fake_apify.py for offline runs
+    apify_api_url: Optional[str] = None
+    sender_email: Optional[str] = None
+    sender_password: Optional[str] = None
+
+
+_settings: Optional[Settings] = None
+_supabase: Optional["Client"] = None
+_apify: Optional["ApifyClientAsync"] = None
+_playwright: Optional["Playwright"] = None
+_browser_pool: Optional["BrowserManager"] = None
+_lock = threading.Lock()
+_browser_lock = asyncio.Lock()
+
+
+def get_settings() -> Settings:
+    global _settings
+    if _settings is None:
+        _settings = Settings(
+            supabase_url=os.getenv("SUPABASE_URL"),
+            supabase_key=os.getenv("SUPABASE_KEY"),
+            openai_api_key=os.getenv("OPEN_AI_API_KEY"),
+            apify_token=os.getenv("APIFY_TOKEN"),
+            apify_api_url=os.getenv("APIFY_API_URL"),
+            sender_email=os.getenv("SENDER_EMAIL"),
+            sender_password=os.getenv("SENDER_PASSWORD"),
+        )
+    return _settings
+
+
+def get_supabase() -> "Client":
+    global _supabase
+    with _lock:
+        if _supabase is None:
+            from supabase import create_client
+            settings = get_settings()
+            _supabase = create_client(settings.supabase_url, settings.supabase_key)
+    return _supabase
+
+
+def get_apify() -> "ApifyClientAsync":
+    global _apify
+    with _lock:
+        if _apify is None:
+            from apify_client import ApifyClientAsync
+            settings = get_settings()
+            _apify = ApifyClientAsync(settings.apify_token, api_url=settings.apify_api_url)
+    return _apify
+
+
+async def get_browser_pool() -> "BrowserManager":
+    """Starts Playwright and the Chromium instances the first time a scrape needs a browser."""
+    global _playwright, _browser_pool
+    if _browser_pool is None:
+        async with _browser_lock:
+            if _browser_pool is None:
+                from playwright.async_api import async_playwright
+                from lib.browser_manager import BrowserManager
+                print("Starting up Playwright browser...")
+                _playwright = await async_playwright().start()
+                browser_pool = BrowserManager(_playwright)
+                await browser_pool.start()
+                _browser_pool = browser_pool
+                print("Playwright browser started.")
+    return _browser_pool
+
+
+def browser_pool_stats() -> dict:
+    """BrowserManager.stats(), with no browsers listed until they are launched."""
+    return _browser_pool.stats() if _browser_pool else {"browsers": []}
+
+
+async def close_browser_pool():
+    global _playwright, _browser_pool
+    async with _browser_lock:
+        if _browser_pool is not None:
+            print("Shutting down Playwright browser...")
+            await _browser_pool.close()
+            _browser_pool = None
+        if _playwright is not None:
+            await _playwright.stop()
+            _playwright = None
+            print("Playwright browser shut down.")
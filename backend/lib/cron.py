@@ -1,37 +1,45 @@
+import argparse
 import os
+import time
 from dotenv import load_dotenv
 from datetime import datetime, timezone, timedelta
-from supabase import create_client, Client
+from typing import List, Optional, Tuple
+from supabase import Client
 from lib import send_email_func
-import time
-import random
+from lib.smtp_pool import smtp_pool, SMTPDeliveryUnknown
+from lib.dispatch import dispatch_batch, BatchSummary, SendRejected, DISPATCH_MAX_SECONDS
+from lib.scheduler import SendScheduler
+from lib.sent_buffer import SentBuffer
+from lib import leasing, prerender
+from lib.metrics import timed, SUPABASE_SECONDS
+from lib.clients import get_supabase
+import asyncio
 load_dotenv()
 
-# Load your Supabase credentials
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+# --- CONFIG ---
+SEND_WINDOW_MINUTES = int(os.getenv("SEND_WINDOW_MINUTES", "15"))
+# Off by default: rows are only sent within SEND_WINDOW_MINUTES of their scheduled time,
+# since a cold email hours late may land outside business hours. When set, rows up to this
+# many hours overdue are sent too, oldest first, so a skipped or failed run loses nothing.
+# `--catch-up HOURS` does the same for a single run
+CATCH_UP_HOURS = float(os.getenv("CATCH_UP_HOURS", "0"))
+
+_sent_buffer: Optional[SentBuffer] = None
 
-supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
+def get_sent_buffer() -> SentBuffer:
+    """One buffer per process, so its journal and pending rows outlive a single batch."""
+    global _sent_buffer
+    if _sent_buffer is None:
+        _sent_buffer = SentBuffer(get_supabase())
+    return _sent_buffer
 
-def fetch_scheduled_emails(supabase: Client):
+def send_window(catch_up_hours: float = CATCH_UP_HOURS) -> Tuple[datetime, datetime]:
     # Current time (UTC, to the minute)
     current_time = datetime.now(timezone.utc).replace(second=0, microsecond=0)
 
-    # Define a 10-minute window around current time
-    window_start = current_time - timedelta(minutes=15)
-    window_end = current_time + timedelta(minutes=15)
-
-    # Query rows within the time window
-    response = (
-        supabase.table("scheduled-emails")
-        .select("*")
-        .gte("scheduled_time", window_start.isoformat())
-        .lte("scheduled_time", window_end.isoformat())
-        .eq("sent", False) 
-        .execute()
-    )
-
-    return response.data or []
+    # SEND_WINDOW_MINUTES either side of the current time, reaching back over overdue rows
+    window = timedelta(minutes=SEND_WINDOW_MINUTES)
+    return current_time - max(window, timedelta(hours=catch_up_hours)), current_time + window
 
 def send_email(record):
     try:
@@ -43,52 +51,173 @@ def send_email(record):
             "id": record.get("id"),
             "email_inbox": record.get("mailbox")
         }
-        success, error_message = send_email_func.send_email(
+        # Rendered when the row was scheduled; only Date and Message-ID are added now
+        success, error_message = send_email_func.send_payload(
             to_address=payload["recipient"],
-            subject=payload["subject"],
-            body_text=payload["body"],
-            sender_name=payload["sender_name"],
-            email_inbox=payload["email_inbox"]
+            email_inbox=payload["email_inbox"],
+            payload=prerender.payload_for(record),
         )
         if success:
-            mark_as_sent(supabase_client, payload["id"])
+            # Journaled locally, moved to sent-emails in the next bulk flush
+            get_sent_buffer().add({**record, "body_text": prerender.body_text(record)})
             print(f"✅ Email sent successfully to {payload['recipient']}")
+            return True
         else:
             print(f"❌ Email failed to send to {payload['recipient']}")
+            return False
 
+    except SMTPDeliveryUnknown as e:
+        # It may well have been delivered; better one missing email than a cold email sent twice
+        raise SendRejected(f"Delivery unknown, not retried: {e}") from e
     except Exception as e:
-        print(f"❌ Failed to send email to {payload['recipient']}: {e}")
+        print(f"❌ Failed to send email to {record.get('recipient')}: {e}")
+        return False
+
+
+def build_scheduler(supabase: Client, lease: leasing.Lease, unrecorded: List[dict]) -> SendScheduler:
+    """
+    Seeds a SendScheduler with everything already counting against the inbox caps,
+    so restarts, overlapping runs and other workers share one budget: the last 24h
+    of sent-emails, `unrecorded` sends still in this process's SentBuffer, and rows
+    leases taken before `lease` hold (counted as sent now, they may go out at any
+    moment). Later leases count this one in turn, so two runs never both spend a cap.
+    """
+    scheduler = SendScheduler()
+    since = scheduler.now - timedelta(days=1)
+    response = (
+        supabase.table("sent-emails")
+        .select("scheduled_id,mailbox,sent_at")
+        .gte("sent_at", since.isoformat())
+        .execute()
+    )
+    counted = set()
+    for row in (response.data or []) + unrecorded:
+        # A flush can land between the two reads, so a send may show up in both
+        if row.get("scheduled_id") is not None:
+            if row["scheduled_id"] in counted:
+                continue
+            counted.add(row["scheduled_id"])
+        if row.get("mailbox") and row.get("sent_at"):
+            scheduler.record_sent(row["mailbox"], datetime.fromisoformat(row["sent_at"]))
+    leased = (
+        supabase.table("scheduled-emails")
+        .select("id,mailbox,lease_token,lease_expires_at")
+        .eq("sent", False)
+        .gt("lease_expires_at", scheduler.now.isoformat())
+        .execute()
+    ).data or []
+    # Leases are ordered by expiry, set from the database clock at claim time, then token
+    claim_order = lambda row: (datetime.fromisoformat(row["lease_expires_at"]), row["lease_token"])
+    ours = [claim_order(row) for row in leased if row["lease_token"] == lease.token]
+    ours = ours[0] if ours else (lease.expires_at, lease.token)
+    for row in leased:
+        # Sent but not recorded yet: its lease is still live, and it was counted above
+        if row.get("mailbox") and row["id"] not in counted and claim_order(row) < ours:
+            scheduler.record_sent(row["mailbox"], scheduler.now)
+    return scheduler
+
+async def _flush_periodically(buffer: SentBuffer):
+    while True:
+        await asyncio.sleep(buffer.flush_seconds)
+        with timed(SUPABASE_SECONDS, "supabase.flush_sent", operation="flush_sent"):
+            await asyncio.to_thread(buffer.flush_if_due)
+
+async def run_batch(catch_up_hours: float = CATCH_UP_HOURS) -> BatchSummary:
+    started = time.monotonic()
+    # The first batch in a process also builds the Supabase client, keep that off the loop
+    sent_buffer = await asyncio.to_thread(get_sent_buffer)
+    supabase_client = sent_buffer.supabase
+    # Record anything a crashed run sent but never wrote back, before it can be picked up again
+    with timed(SUPABASE_SECONDS, "supabase.replay_journal", operation="replay_journal"):
+        await asyncio.to_thread(sent_buffer.replay)
 
+    window_start, window_end = send_window(catch_up_hours)
+    # Rows scheduled before the window around now are only claimed because of catch-up
+    overdue_before = datetime.now(timezone.utc) - timedelta(minutes=SEND_WINDOW_MINUTES)
+    summary = BatchSummary()
+    scheduler = flusher = cursor = None
+    try:
+        # One page of CLAIM_BATCH_SIZE rows at a time, oldest first, until the queue
+        # is drained or the dispatch budget runs out
+        while (remaining := DISPATCH_MAX_SECONDS - (time.monotonic() - started)) > 0:
+            # Claimed rows are ours until the lease expires, so overlapping runs and
+            # other workers never send the same row
+            with timed(SUPABASE_SECONDS, "supabase.claim", operation="claim"):
+                lease = await asyncio.to_thread(
+                    leasing.claim_batch, supabase_client, window_start, window_end, after=cursor
+                )
+            if not lease.rows:
+                break
+            cursor = lease.cursor
+            already_sent = sent_buffer.pending_ids()
+            scheduled_emails = [record for record in lease.rows if record["id"] not in already_sent]
+            overdue = sum(datetime.fromisoformat(record["scheduled_time"]) < overdue_before for record in scheduled_emails)
+            print(
+                f"🔒 Claimed {len(scheduled_emails)} email(s) as {lease.owner}"
+                f"{f' ({overdue} overdue)' if overdue else ''}, lease expires {lease.expires_at.isoformat()}"
+            )
 
-def mark_as_sent(supabase: Client, email_id: int):
-    # Fetch the email record to get its details
-    response = supabase.table("scheduled-emails").select("sender_name,recipient,body_text,scheduled_time,mailbox").eq("id", email_id).single().execute()
-    record = response.data
+            # Re-seeded for every page, picking up what other runs have claimed or sent since
+            with timed(SUPABASE_SECONDS, "supabase.sent_history", operation="sent_history"):
+                scheduler = await asyncio.to_thread(
+                    build_scheduler, supabase_client, lease, sent_buffer.pending_rows()
+                )
+            if flusher is None:
+                flusher = asyncio.create_task(_flush_periodically(sent_buffer))
+            last_slots = {}
+            for record, slot in scheduler.plan(r for r in scheduled_emails if r.get("mailbox")):
+                last_slots[record["mailbox"]] = slot
+            for mailbox, slot in last_slots.items():
+                print(f"🗓️ [{mailbox}] Last email of this page planned for {slot.isoformat()}")
 
-    if record:
-        # Insert into sent-emails table
-        supabase.table("sent-emails").insert({
-            "name": record.get("sender_name"),
-            "email": record.get("recipient"),
-            "sent_at":record.get("scheduled_time"),
-            "body_text": record.get("body_text"),
-            "mailbox": record.get("mailbox")
-        }).execute()
-        supabase.table("scheduled-emails").delete().eq("id", email_id).execute()
+            # One lane per mailbox, rate-limited per inbox, 4–8 s jitter between sends of the same mailbox
+            page = await dispatch_batch(scheduled_emails, send_email, max_seconds=remaining, scheduler=scheduler)
+            summary.merge(page)
 
-def main():
-    scheduled_emails = fetch_scheduled_emails(supabase_client)
+            # Rejected rows leave the queue for good, so later runs don't claim and fail them again
+            if page.rejected:
+                with timed(SUPABASE_SECONDS, "supabase.fail", operation="fail"):
+                    await asyncio.to_thread(leasing.fail, supabase_client, lease, page.rejected)
+            # Failed and deferred rows go back to the queue now instead of when the lease runs out;
+            # the cursor keeps this run from claiming them again
+            done = set(page.sent_ids) | set(page.rejected)
+            with timed(SUPABASE_SECONDS, "supabase.release", operation="release"):
+                await asyncio.to_thread(
+                    leasing.release, supabase_client, lease,
+                    [record["id"] for record in scheduled_emails if record["id"] not in done],
+                )
+            # Deferred rows mean the budget ran out, a short page that the queue is empty
+            if page.deferred or len(lease.rows) < leasing.CLAIM_BATCH_SIZE:
+                break
+    finally:
+        if flusher is not None:
+            flusher.cancel()
+            with timed(SUPABASE_SECONDS, "supabase.flush_sent", operation="flush_sent"):
+                await asyncio.to_thread(sent_buffer.flush)
 
-    if not scheduled_emails:
+    if scheduler is None:
         print("No scheduled emails at this time.")
-        return
-
-    for record in scheduled_emails:
-        send_email(record)
-        # print(f"Attempting to send email to {record.get('recipient')} scheduled at {record.get('scheduled_time')}")
-        # random delay between 4–8 seconds
-        delay = random.uniform(4, 8)
-        print(f"⏳ Sleeping for {delay:.2f} seconds before next email...")
-        time.sleep(delay)
-        
-main()
+        return summary
+
+    # Sessions idle for a whole cron interval would be timed out server-side anyway
+    smtp_pool.close()
+    # Catch rows scheduled without a pre-render request, so the next window sends them as-is
+    with timed(SUPABASE_SECONDS, "supabase.prerender", operation="prerender"):
+        await asyncio.to_thread(prerender.prerender_pending, supabase_client)
+    summary.duration_seconds = round(time.monotonic() - started, 2)
+    print(
+        f"📬 Batch done in {summary.duration_seconds}s: "
+        f"{summary.sent} sent, {summary.failed} failed, {summary.deferred} deferred"
+    )
+    return summary
+
+def main(catch_up_hours: float = CATCH_UP_HOURS):
+    return asyncio.run(run_batch(catch_up_hours))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send the scheduled emails that are due.")
+    parser.add_argument(
+        "--catch-up", type=float, default=CATCH_UP_HOURS, metavar="HOURS",
+        help=f"also send rows up to this many hours overdue, for recovering from missed runs (default {CATCH_UP_HOURS:g})",
+    )
+    main(parser.parse_args().catch_up)
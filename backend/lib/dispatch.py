@@ -0,0 +1,149 @@
+import asyncio
+import os
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+from pydantic import BaseModel
+from dotenv import load_dotenv
+from lib.scheduler import SendScheduler
+from lib.metrics import EMAILS_TOTAL
+
+load_dotenv()
+
+# --- CONFIG ---
+# Jittered gap between two sends from the same mailbox (other mailboxes are not affected)
+LANE_MIN_DELAY = float(os.getenv("LANE_MIN_DELAY", "4"))
+LANE_MAX_DELAY = float(os.getenv("LANE_MAX_DELAY", "8"))
+# Anything a lane has not started by then is left for the next cron run
+DISPATCH_MAX_SECONDS = float(os.getenv("DISPATCH_MAX_SECONDS", "900"))
+
+
+class SendRejected(Exception):
+    """Raised by a send_record for a row that must not be retried; the message is the reason."""
+
+
+class LaneSummary(BaseModel):
+    sent: int = 0
+    failed: int = 0
+    deferred: int = 0
+
+
+class BatchSummary(BaseModel):
+    sent: int = 0
+    failed: int = 0
+    deferred: int = 0
+    duration_seconds: float = 0.0
+    mailboxes: Dict[str, LaneSummary] = {}
+    sent_ids: List[int] = []
+    # Failed rows that must not be retried, with the reason (counted in `failed` too)
+    rejected: Dict[int, str] = {}
+
+    def merge(self, other: "BatchSummary"):
+        """Adds another batch's counts to this one, for a run dispatched page by page."""
+        for mailbox, lane in other.mailboxes.items():
+            total = self.mailboxes.setdefault(mailbox, LaneSummary())
+            total.sent += lane.sent
+            total.failed += lane.failed
+            total.deferred += lane.deferred
+        self.sent += other.sent
+        self.failed += other.failed
+        self.deferred += other.deferred
+        self.sent_ids.extend(other.sent_ids)
+        self.rejected.update(other.rejected)
+
+
+async def _run_lane(
+    mailbox: str,
+    records: List[dict],
+    send_record: Callable[[dict], bool],
+    deadline: float,
+    min_delay: float,
+    max_delay: float,
+    scheduler: Optional[SendScheduler],
+    sent_ids: List[int],
+    rejected: Dict[int, str],
+) -> LaneSummary:
+    lane = LaneSummary()
+    for index, record in enumerate(records):
+        wait, slot = 0.0, None
+        if scheduler is not None:
+            slot = scheduler.next_slot(mailbox)
+            wait = max((slot - datetime.now(timezone.utc)).total_seconds(), 0.0)
+        if time.monotonic() + wait >= deadline:
+            lane.deferred += len(records) - index
+            print(f"⏸️ [{mailbox}] Deadline reached, deferring {lane.deferred} email(s)")
+            break
+        if scheduler is not None:
+            # Only booked once the send is going ahead, so deferred rows keep their budget
+            scheduler.reserve(mailbox, slot)
+        if wait:
+            print(f"🪣 [{mailbox}] Rate limit reached, waiting {wait:.0f} seconds for the next slot...")
+            await asyncio.sleep(wait)
+        # send_record is blocking (pooled smtplib), keep it off the event loop
+        try:
+            success = await asyncio.to_thread(send_record, record)
+        except SendRejected as e:
+            success = False
+            rejected[record.get("id")] = str(e)
+        if success:
+            lane.sent += 1
+            sent_ids.append(record.get("id"))
+        else:
+            lane.failed += 1
+        if index < len(records) - 1:
+            delay = random.uniform(min_delay, max_delay)
+            print(f"⏳ [{mailbox}] Sleeping for {delay:.2f} seconds before next email...")
+            await asyncio.sleep(delay)
+    return lane
+
+
+async def dispatch_batch(
+    records: List[dict],
+    send_record: Callable[[dict], bool],
+    max_seconds: Optional[float] = DISPATCH_MAX_SECONDS,
+    min_delay: float = LANE_MIN_DELAY,
+    max_delay: float = LANE_MAX_DELAY,
+    scheduler: Optional[SendScheduler] = None,
+) -> BatchSummary:
+    """
+    Sends `records` with one worker lane per `mailbox`, so every sender inbox
+    runs in parallel and pacing only applies between sends of the same inbox.
+    With a `scheduler`, each send also waits for its inbox's next rate-limit slot.
+    `send_record` must return True on success, and raises SendRejected for a row
+    that must not be retried; those end up in `rejected` along with rows that
+    have no mailbox.
+    """
+    started = time.monotonic()
+    deadline = started + max_seconds if max_seconds else float("inf")
+
+    lanes: Dict[str, List[dict]] = defaultdict(list)
+    summary = BatchSummary()
+    for record in records:
+        mailbox = record.get("mailbox")
+        if not mailbox:
+            print(f"❌ Scheduled email {record.get('id')} has no mailbox, skipping")
+            summary.failed += 1
+            summary.rejected[record.get("id")] = "No mailbox to send from"
+            EMAILS_TOTAL.labels(mailbox="none", outcome="failed").inc()
+            continue
+        lanes[mailbox].append(record)
+
+    results = await asyncio.gather(*(
+        _run_lane(
+            mailbox, lane_records, send_record, deadline, min_delay, max_delay, scheduler,
+            summary.sent_ids, summary.rejected,
+        )
+        for mailbox, lane_records in lanes.items()
+    ))
+
+    for mailbox, lane in zip(lanes.keys(), results):
+        for outcome in ("sent", "failed", "deferred"):
+            EMAILS_TOTAL.labels(mailbox=mailbox, outcome=outcome).inc(getattr(lane, outcome))
+        summary.mailboxes[mailbox] = lane
+        summary.sent += lane.sent
+        summary.failed += lane.failed
+        summary.deferred += lane.deferred
+    summary.duration_seconds = round(time.monotonic() - started, 2)
+    return summary
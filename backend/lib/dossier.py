@@ -2,12 +2,24 @@ from fastapi import HTTPException
 from pydantic import BaseModel
 import os
 from dotenv import load_dotenv
-from typing import List
-from openai import OpenAI
-from playwright.async_api import Browser
-from html_to_markdown import convert_to_markdown
-from apify_client import ApifyClient
-from strip_markdown import strip_markdown
+from typing import List, Optional, Tuple
+import hashlib
+import re
+import time
+from collections import Counter
+from lib.browser_pool import BrowserPool, BrowserPoolSaturated, USER_AGENT
+from lib.dossier_cache import DossierCache
+from lib.extract import BudgetedTextExtractor, extract_text_from_page, MAX_DOSSIER_TOKENS
+from lib.qualify import qualify, DEFAULT_CAMPAIGN
+from lib.llm import llm, response_cache_key, LLM_ENABLED
+from lib.token_budget import compress_dossier
+from lib.templates import render_email
+from lib.metrics import timed, SCRAPE_SECONDS, SCRAPE_STAGE_SECONDS, GENERATE_SECONDS
+from lib.clients import get_browser_pool
+from lib.linkedin import linkedin, LINKEDIN_RUN_TIMEOUT
+import httpx
+from playwright.async_api import BrowserContext, Page, Route, TimeoutError as PlaywrightTimeoutError
+from urllib.parse import urljoin, urlparse
 import asyncio
 import sys
 
@@ -16,15 +28,46 @@ if sys.platform.startswith("win"):
 
 # Load environment variables
 load_dotenv()
-print("\033[1;32;40mA PENDORIAN PRODUCTION\033[0m")
-print("\033[1;32;40mA PENDORIAN PRODUCTION\033[0m")
 
-# Initialize API clients from environment variables
+# --- SCRAPE CONFIG ---
+# "text" only lets documents, scripts and XHR through; "full" loads the page as a browser would
+SCRAPE_MODE = os.getenv("SCRAPE_MODE", "text")
+# One of Playwright's wait_until values: commit, domcontentloaded, load, networkidle
+SCRAPE_WAIT_UNTIL = os.getenv("SCRAPE_WAIT_UNTIL", "domcontentloaded")
+# Whole-scrape budget per URL (navigation and extraction)
+SCRAPE_TIMEOUT_MS = int(os.getenv("SCRAPE_TIMEOUT_MS", "20000"))
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font", "stylesheet", "texttrack", "manifest", "ping"}
+BLOCKED_DOMAINS = (
+    "google-analytics.com", "googletagmanager.com", "googleadservices.com", "doubleclick.net",
+    "facebook.net", "connect.facebook.net", "hotjar.com", "clarity.ms", "segment.com", "segment.io",
+    "mixpanel.com", "hs-analytics.net", "hs-scripts.com", "snap.licdn.com", "bat.bing.com",
+    "fullstory.com", "js-agent.newrelic.com", "analytics.tiktok.com", "static.ads-twitter.com",
+)
+# Plain HTTP is tried first; the browser only runs when the HTTP result looks unusable
+HTTP_FIRST = os.getenv("HTTP_FIRST", "true").lower() == "true"
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+HTTP_MIN_TEXT_LENGTH = int(os.getenv("HTTP_MIN_TEXT_LENGTH", "500"))
+# Markers of client-rendered shells that carry no content until JavaScript runs
+JS_SHELL_MARKERS = (
+    '<div id="root"></div>', '<div id="app"></div>', '<div id="__next"></div>',
+    "enable javascript", "requires javascript", "javascript is disabled",
+)
 
-openai_api_key = os.getenv("OPEN_AI_API_KEY")
-apify_token = os.getenv("APIFY_TOKEN")
-client = OpenAI(api_key=openai_api_key)
-apify_client = ApifyClient(apify_token)
+# Optional crawl of a few high-value internal pages linked from the landing page
+CRAWL_ENABLED = os.getenv("CRAWL_ENABLED", "false").lower() == "true"
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "4"))
+CRAWL_TIME_BUDGET_MS = int(os.getenv("CRAWL_TIME_BUDGET_MS", "8000"))
+# Earlier keywords win; a link matches on its path or its anchor text
+CRAWL_KEYWORDS = ("about", "services", "service", "pricing", "prices", "team", "what-we-do", "solutions", "case-studies")
+# Pages sharing at least this share of word shingles with an earlier page are dropped
+CRAWL_DUPLICATE_SIMILARITY = float(os.getenv("CRAWL_DUPLICATE_SIMILARITY", "0.8"))
+CRAWL_MAX_LINKS = 300
+
+# Which tier served each scrape, so the heuristics can be tuned from the hit rate
+fetch_tier_stats: Counter = Counter()
+_http_client: Optional[httpx.AsyncClient] = None
+DOSSIER_CACHE_ENABLED = os.getenv("DOSSIER_CACHE_ENABLED", "true").lower() == "true"
+dossier_cache = DossierCache() if DOSSIER_CACHE_ENABLED else None  # opens its file on first use
 
 
 
@@ -42,57 +85,326 @@ class EmailRequest(BaseModel):
     is_qualified:bool
 
 # --- Your Existing Functions (Modified for server context) ---
-def extract_linkedin_posts(url: str) -> List[str]:
-    """Extracts recent posts from a LinkedIn profile URL using Apify."""
+async def extract_linkedin_posts(url: str) -> List[str]:
+    """
+    Recent posts from a LinkedIn profile, waiting for the Apify run when they aren't cached.
+    Empty when LINKEDIN_ENABLED is off; the endpoints use lib.linkedin directly so they don't wait.
+    """
     print(f"Extracting LinkedIn posts from: {url}")
-    try:
-        linkedin_json = {
-            "deepScrape": False,
-            "limitPerSource": 3,
-            "rawData": False,
-            "urls": [url]
-        }
-        actor_run = apify_client.actor('supreme_coder/linkedin-post').call(
-            run_input=linkedin_json
+    return await linkedin.posts(await linkedin.request(url), wait=LINKEDIN_RUN_TIMEOUT)
+def get_http_client() -> httpx.AsyncClient:
+    """Shared keep-alive HTTP/2 client for the HTTP scrape tier."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            follow_redirects=True,
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            headers={
+                "User-Agent": USER_AGENT,
+                "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.8",
+                "Accept-Language": "en-US,en;q=0.9",
+            },
         )
-        dataset_items = apify_client.dataset(actor_run['defaultDatasetId']).list_items().items
-        posts = list(map(lambda x: x["text"], dataset_items))
-        return posts
-    except Exception as e:
-        print(f"Error extracting LinkedIn posts: {e}")
+    return _http_client
+
+async def close_http_client():
+    if _http_client is not None:
+        await _http_client.aclose()
+
+def _validators(headers) -> dict:
+    return {"etag": headers.get("etag"), "last_modified": headers.get("last-modified")}
+
+async def _read_http(response: httpx.Response, max_tokens: int, max_links: int) -> Tuple[Optional[BudgetedTextExtractor], str, dict]:
+    """Streams an open response through the budgeted text extractor, see _fetch_http."""
+    if response.status_code != 200 or "html" not in response.headers.get("content-type", ""):
+        return None, "", {}
+    extractor = BudgetedTextExtractor(max_tokens * 4, max_links)
+    head = ""
+    async for chunk in response.aiter_text():
+        if len(head) < 65536:
+            head += chunk[:65536 - len(head)]
+        extractor.feed(chunk)
+        if extractor.full:
+            break
+    extractor.close()
+    return extractor, head, _validators(response.headers)
+
+async def _fetch_http(url: str, max_tokens: int, max_links: int = 0) -> Tuple[Optional[BudgetedTextExtractor], str, dict]:
+    """
+    Streams a plain GET through the budgeted text extractor and stops reading
+    once the budget is full. Returns the filled extractor (None when it isn't
+    an HTML page), the first 64 KB of HTML for the JS-shell check, and the
+    response's cache validators.
+    """
+    try:
+        async with get_http_client().stream("GET", url) as response:
+            return await _read_http(response, max_tokens, max_links)
+    except httpx.HTTPError as e:
+        print(f"HTTP fetch failed for {url}: {e}")
+        return None, "", {}
+
+async def _revalidate(url: str, entry: dict, max_tokens: int, max_links: int = 0) -> Tuple[bool, Optional[tuple]]:
+    """
+    Conditional GET against the origin. Returns (True, None) when it answers
+    304 Not Modified. Otherwise the page has changed and the response is read
+    as _fetch_http would, returned second so it is not downloaded again.
+    """
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    if not headers:
+        return False, None
+    try:
+        async with get_http_client().stream("GET", url, headers=headers) as response:
+            if response.status_code == 304:
+                return True, None
+            # Without the HTTP tier the browser scrapes the page anyway, so don't read the body
+            return False, (await _read_http(response, max_tokens, max_links) if HTTP_FIRST else None)
+    except httpx.HTTPError:
+        return False, None
+
+def _looks_usable(html_head: str, plain_text: str) -> bool:
+    if len(plain_text.strip()) < HTTP_MIN_TEXT_LENGTH:
+        return False
+    lowered = html_head.lower()
+    return not any(marker in lowered for marker in JS_SHELL_MARKERS)
+
+def _is_tracker(url: str) -> bool:
+    host = urlparse(url).hostname or ""
+    return any(host == domain or host.endswith("." + domain) for domain in BLOCKED_DOMAINS)
+
+async def _block_heavy_resources(route: Route):
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or _is_tracker(request.url):
+        await route.abort()
+    else:
+        await route.continue_()
+
+async def _navigate(page: Page, url: str, mode: str, wait_until: str, timeout_ms: int) -> dict:
+    """Loads `url` and returns the document response's cache validators."""
+    if mode == "text":
+        await page.route("**/*", _block_heavy_resources)
+    try:
+        response = await page.goto(url, wait_until=wait_until, timeout=timeout_ms)
+    except PlaywrightTimeoutError:
+        # networkidle never settles on chatty sites, the DOM we have is usually enough
+        if wait_until != "networkidle":
+            raise
+        print(f"networkidle not reached for {url}, using the DOM as loaded so far")
+        return {}
+    return _validators(response.headers) if response else {}
+
+def _rank_crawl_links(base_url: str, links: List[Tuple[str, str]], max_pages: int) -> List[str]:
+    """Picks up to `max_pages` same-site links, ordered by CRAWL_KEYWORDS priority."""
+    base = urlparse(base_url)
+    base_host = (base.hostname or "").removeprefix("www.")
+    ranked = {}
+    for href, text in links:
+        absolute = urljoin(base_url, href.strip()).split("#")[0].rstrip("/")
+        parsed = urlparse(absolute)
+        if parsed.scheme not in ("http", "https") or (parsed.hostname or "").removeprefix("www.") != base_host:
+            continue
+        if parsed.path.rstrip("/") in ("", base.path.rstrip("/")):
+            continue
+        haystack = f"{parsed.path} {text}".lower()
+        for priority, keyword in enumerate(CRAWL_KEYWORDS):
+            if keyword in haystack:
+                if absolute not in ranked or priority < ranked[absolute]:
+                    ranked[absolute] = priority
+                break
+    return sorted(ranked, key=lambda link: ranked[link])[:max_pages]
+
+def _shingles(text: str) -> set:
+    words = re.findall(r"\w+", text.lower())
+    return {hashlib.blake2b(" ".join(words[i:i + 5]).encode(), digest_size=8).digest() for i in range(max(len(words) - 4, 1))}
+
+def _merge_pages(landing_text: str, pages: List[Tuple[str, str]], max_tokens: int) -> Tuple[str, bool]:
+    """Appends crawled pages in priority order, skipping near-duplicates, within the token budget."""
+    merged = [landing_text]
+    length = len(landing_text)
+    max_chars = max_tokens * 4
+    seen = [_shingles(landing_text)]
+    for link, text in pages:
+        if not text:
+            continue
+        shingles = _shingles(text)
+        if any(len(shingles & other) / max(min(len(shingles), len(other)), 1) >= CRAWL_DUPLICATE_SIMILARITY for other in seen):
+            print(f"Skipping near-duplicate page {link}")
+            continue
+        seen.append(shingles)
+        section = f"\n\nPage: {urlparse(link).path}\n{text}"
+        if length + len(section) > max_chars:
+            merged.append(section[:max_chars - length])
+            return "".join(merged), True
+        merged.append(section)
+        length += len(section)
+    return "".join(merged), False
+
+async def _gather_within(coroutines: list, timeout: float) -> list:
+    """Runs coroutines concurrently and returns the results that finished in time, in order."""
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    if not tasks:
         return []
-async def extract_info_from_website(url: str, browser: Browser):
-    """Scrapes a website using a pre-initialized browser and returns a summary."""
-    max_tokens_per_page = 100000
-    is_qualified=False
-    summary_prompt = """
-        Use the markdown from the website below and write me a detailed description of what the business is about.
-        Here's the content of a website. Give me as much detail as possible.
+    done, pending = await asyncio.wait(tasks, timeout=max(timeout, 0))
+    for task in pending:
+        task.cancel()
+    # Let the stragglers run their cleanup now rather than after the caller has moved on
+    await asyncio.gather(*pending, return_exceptions=True)
+    return [task.result() if task in done and not task.exception() else None for task in tasks]
+
+async def _crawl_http(links: List[str], max_tokens: int, timeout: float) -> List[Tuple[str, str]]:
+    async def fetch(link: str) -> str:
+        extractor, _, _ = await _fetch_http(link, max_tokens)
+        return extractor.text() if extractor else ""
+    results = await _gather_within([fetch(link) for link in links], timeout)
+    return [(link, text) for link, text in zip(links, results) if text]
+
+async def _crawl_browser(
+    context: BrowserContext, links: List[str], mode: str, wait_until: str, timeout: float, max_tokens: int
+) -> List[Tuple[str, str]]:
+    """
+    Loads the links as concurrent pages of the landing page's own context. Every
+    page is closed before this returns, so none outlives the context's checkout.
     """
+    pages: List[Page] = []
+    async def fetch(link: str) -> str:
+        page = await context.new_page()
+        pages.append(page)
+        await _navigate(page, link, mode, wait_until, int(timeout * 1000))
+        text, _ = await extract_text_from_page(page, max_tokens)
+        return text
+    try:
+        results = await _gather_within([fetch(link) for link in links], timeout)
+    finally:
+        await asyncio.gather(*(page.close() for page in pages), return_exceptions=True)
+    return [(link, text) for link, text in zip(links, results) if text]
+
+async def extract_info_from_website(
+    url: str,
+    browser_pool: Optional[BrowserPool] = None,
+    mode: str = SCRAPE_MODE,
+    wait_until: str = SCRAPE_WAIT_UNTIL,
+    timeout_ms: int = SCRAPE_TIMEOUT_MS,
+    max_tokens: int = MAX_DOSSIER_TOKENS,
+    crawl: bool = CRAWL_ENABLED,
+    campaign: str = DEFAULT_CAMPAIGN,
+):
+    """
+    Scrapes a website using a page from the shared browser pool and returns a summary.
+    Without `browser_pool`, the browsers from lib.clients are used, launched on first need.
+    With `crawl`, a few high-value internal pages are fetched concurrently and merged in.
+    The dossier is scored against the `campaign`'s qualification terms.
+    """
+    cache_variant = "crawl" if crawl else ""
     print(f"Extracting website info from: {url}")
+    scrape_started = time.perf_counter()
+    tier, outcome = "none", "error"
     try:
-        # We get a new page from the existing browser instance
-        page = await browser.new_page()
-        await page.goto(url)
-        body_html = await page.query_selector("body")
-        html_raw = await body_html.inner_html()
-        markdown_text:str = convert_to_markdown(html_raw)
-        plain_text:str = strip_markdown(markdown_text)
-
-        if (len(plain_text) / 4) > max_tokens_per_page:
-            print("Website content too large to summarize.")
-            await page.close()  # Close the page, not the browser
-            return None
-        if("audit" in plain_text):
-            is_qualified = True
+        with timed(SCRAPE_STAGE_SECONDS, "scrape.cache_lookup", stage="cache_lookup"):
+            # SQLite reads and writes go through a thread, never on the event loop
+            cached = await asyncio.to_thread(dossier_cache.get, url, cache_variant) if dossier_cache else None
+        max_links = CRAWL_MAX_LINKS if crawl else 0
+        revalidated = None
+        if cached and not cached["is_fresh"]:
+            with timed(SCRAPE_STAGE_SECONDS, "scrape.revalidate", stage="revalidate"):
+                not_modified, revalidated = await _revalidate(url, cached, max_tokens, max_links)
+            if not_modified:
+                await asyncio.to_thread(dossier_cache.mark_revalidated, url, cache_variant)
+                cached["is_fresh"] = True
+        if cached and cached["is_fresh"]:
+            tier, outcome = "cache", "ok"
+            fetch_tier_stats["cache"] += 1
+            print(f"Served {url} from the dossier cache")
+            # Re-scored on every hit so campaign term changes apply to cached dossiers too
+            with timed(SCRAPE_STAGE_SECONDS, "scrape.qualification", stage="qualification"):
+                qualification = qualify(cached["dossier"], campaign)
+            return {"dossier":cached["dossier"], **qualification.model_dump(), "tier":"cache"}
+
+        tier = "browser"
+        started = time.monotonic()
+        extractor, html_head, validators = None, "", {}
+        if revalidated:
+            # The page changed since it was cached; the revalidation request already fetched it
+            extractor, html_head, validators = revalidated
+        elif HTTP_FIRST:
+            with timed(SCRAPE_STAGE_SECONDS, "scrape.http_fetch", stage="http_fetch"):
+                extractor, html_head, validators = await _fetch_http(url, max_tokens, max_links)
+        plain_text = extractor.text() if extractor else None
+        if plain_text is not None and _looks_usable(html_head, plain_text):
+            tier = "http"
+            truncated = extractor.truncated
+            if crawl:
+                with timed(SCRAPE_STAGE_SECONDS, "scrape.crawl", stage="crawl"):
+                    links = _rank_crawl_links(url, [(href, "") for href in extractor.links], CRAWL_MAX_PAGES)
+                    budget = CRAWL_TIME_BUDGET_MS / 1000 - (time.monotonic() - started)
+                    pages = await _crawl_http(links, max_tokens, budget)
+                    plain_text, truncated = _merge_pages(plain_text, pages, max_tokens)
+        else:
+            # The landing page and any crawl pages are closed before the context goes back to the pool
+            async with (browser_pool or await get_browser_pool()).checkout() as context:
+                page = await context.new_page()
+                try:
+                    async with asyncio.timeout(timeout_ms / 1000):
+                        with timed(SCRAPE_STAGE_SECONDS, "scrape.navigation", stage="navigation"):
+                            validators = await _navigate(page, url, mode, wait_until, timeout_ms)
+                        with timed(SCRAPE_STAGE_SECONDS, "scrape.dom_extraction", stage="dom_extraction"):
+                            plain_text, truncated = await extract_text_from_page(page, max_tokens)
+                        links = await page.eval_on_selector_all(
+                            "a[href]", f"els => els.slice(0, {max_links}).map(a => [a.href, a.textContent || ''])"
+                        ) if crawl else []
+                finally:
+                    await page.close()
+                if crawl:
+                    with timed(SCRAPE_STAGE_SECONDS, "scrape.crawl", stage="crawl"):
+                        links = _rank_crawl_links(url, links, CRAWL_MAX_PAGES)
+                        budget = CRAWL_TIME_BUDGET_MS / 1000 - (time.monotonic() - started)
+                        pages = await _crawl_browser(context, links, mode, wait_until, budget, max_tokens)
+                        plain_text, truncated = _merge_pages(plain_text, pages, max_tokens)
+        fetch_tier_stats[tier] += 1
+        print(f"Scraped {url} via {tier} tier" + (f" (+{len(links)} crawled link(s))" if crawl else ""))
+
+        if truncated:
+            print(f"Website content over the {max_tokens} token budget, dossier truncated.")
+        with timed(SCRAPE_STAGE_SECONDS, "scrape.qualification", stage="qualification"):
+            qualification = qualify(plain_text, campaign)
+        if qualification.matched_terms:
+            print(f"Qualification score {qualification.score} from {qualification.matched_terms}")
         dossier = plain_text
-        await page.close() # Close the page after use
-        return {"dossier":dossier, "is_qualified":is_qualified}
+        if dossier_cache:
+            await asyncio.to_thread(
+                dossier_cache.put, url, dossier, qualification.is_qualified, variant=cache_variant, **validators
+            )
+        outcome = "ok"
+        return {"dossier":dossier, **qualification.model_dump(), "tier":tier}
+    except BrowserPoolSaturated:
+        # Let the caller turn this into backpressure instead of a scrape failure
+        outcome = "saturated"
+        raise
     except Exception as e:
         print(f"Error extracting website info: {e}")
         return None
-def generateCustomEmail(dossier:  dict[str, any]) -> Custom_Email:
-    """Generates a personalized email and subject line using a language model."""
+    finally:
+        SCRAPE_SECONDS.labels(tier=tier, outcome=outcome).observe(time.perf_counter() - scrape_started)
+def build_lead_dossier(lead: dict, website_content: dict, linkedin_posts: Optional[List[str]] = None) -> dict:
+    """Combines the lead fields of an Email_Request with its scraped website content and any LinkedIn posts."""
+    lead_dossier = {
+        "company_name": lead["company_name"],
+        "decision_maker_name": lead["decision_maker_name"],
+        "decision_maker_title": lead["decision_maker_title"],
+        "website_content": website_content["dossier"],
+        "is_qualified":website_content["is_qualified"],
+        "campaign": lead.get("campaign", DEFAULT_CAMPAIGN),
+    }
+    # Only present when there are posts, so dossiers without them keep their LLM cache keys
+    if linkedin_posts:
+        lead_dossier["linkedin_posts"] = linkedin_posts
+    return lead_dossier
+def _generation_prompts(dossier:  dict[str, any], website_content: str) -> Tuple[str, str]:
+    """The system prompt and user prompt for generating the email for a lead, with the compressed website text."""
     
     # when_you_enable_recording_add_this = "And just so you know, this isn’t some automated blast, I’m a real person. I recorded a quick video running an audit on your very own site."
     example_response= f""" "body":"Hey [decision maker's name],\n \nSo am not sure if this will work for [business name] but I figured I’d reach out anyway. I built a tool that auto-generates a detailed SEO audit for any website you enter. { " It costs just a few cents to run, and I can see it easily helping convert more leads into paid clients with this as a lead magnet." if dossier["is_qualified"] == False else "It only costs a few cents to run. Since it runs almost instantly, you can free up your team to take on more clients."}\n \nI know it's a long shot but would you find someting like this useful? If yes I can get back to you in 30 mins or so with a link to the system. Do you want me to just go ahead and do it?\n \nLooking forward to hearing from you [decision maker name],\nPetrus", "subject":"Could this work for you too [decision maker name]?" """
@@ -126,7 +438,13 @@ def generateCustomEmail(dossier:  dict[str, any]) -> Custom_Email:
 
         -----------------------------------------------------------------------------------------------
         Here's the business information taken from the website:
-        {dossier["website_content"]}
+        {website_content}
+    """
+    if dossier.get("linkedin_posts"):
+        posts = "\n\n".join(f"- {post}" for post in dossier["linkedin_posts"])
+        prompt += f"""
+        Here are {dossier['decision_maker_name']}'s most recent LinkedIn posts:
+        {posts}
     """
     
     system_prompt = f"""
@@ -159,18 +477,30 @@ def generateCustomEmail(dossier:  dict[str, any]) -> Custom_Email:
         Output (JSON only):
         {{ {example_output} }}
     """
+    return system_prompt, prompt
+async def generateCustomEmail(dossier:  dict[str, any]) -> Custom_Email:
+    """
+    Generates a personalized email and subject line using a language model.
+    With LLM_ENABLED off, the campaign's manual template is filled in instead.
+    """
+    mode = "llm" if LLM_ENABLED else "template"
     try:
-        # response = client.responses.parse(
-        #     model="gpt-5-nano", 
-        #     text_format=Custom_Email,
-        #     input=[
-        #         {"role": "system", "content": system_prompt},
-        #         {"role": "user", "content": prompt},
-        #     ]
-        # )
-        manual_body = f"Hey {dossier['decision_maker_name']},\n\nSo am not sure if this will work for {dossier['company_name']} too, but I figured I’d reach out anyway. I built a tool that auto-generates a detailed SEO audit for any website you enter. { " It costs just a few cents to run, and I can see it easily helping convert more leads into paid clients with this as a lead magnet." if dossier["is_qualified"] == False else "It only costs a few cents to run. Since it runs almost instantly, you can free up your team to take on more clients."}\n \nI know it's a long shot but would you find someting like this useful? If yes I can get back to you in 1hr with a link to the system. Do you want me to just go ahead and do it?\n\nLooking forward to hearing from you {dossier['decision_maker_name']},\nPetrus"
-        manual_subject = f"Could this work for you too {dossier['decision_maker_name']}?"
-        return Custom_Email(body=manual_body, subject=manual_subject)
+        with timed(GENERATE_SECONDS, "generate_email", mode=mode, outcome="ok"):
+            if LLM_ENABLED:
+                # The model is billed per token, so the dossier is cut down to the prompt budget first;
+                # tokenizing and scoring it is CPU work, kept off the event loop
+                compression = await asyncio.to_thread(compress_dossier, dossier["website_content"])
+                if compression.tokens_saved:
+                    print(
+                        f"Prompt dossier for {dossier['company_name']}: {compression.tokens_before} -> "
+                        f"{compression.tokens_after} tokens ({compression.tokens_saved} saved)"
+                    )
+                system_prompt, prompt = _generation_prompts(dossier, compression.text)
+                # Awaited on the shared async client, so other requests keep running meanwhile
+                return await llm.parse(Custom_Email, system_prompt, prompt, cache_key=response_cache_key(dossier))
+            # Campaign templates are compiled once, see templates/<campaign>.json
+            manual_subject, manual_body = render_email(dossier, dossier.get("campaign", DEFAULT_CAMPAIGN))
+            return Custom_Email(body=manual_body, subject=manual_subject)
     except Exception as e:
         print(f"Error generating custom email: {e}")
         raise HTTPException(status_code=500, detail="Error generating custom email. Please check the AI models and prompts.")
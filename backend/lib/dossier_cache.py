@@ -0,0 +1,155 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- CONFIG ---
+DOSSIER_CACHE_PATH = os.getenv(
+    "DOSSIER_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dossier-cache.sqlite3"),
+)
+# Entries younger than this are served without touching the site
+DOSSIER_CACHE_TTL = float(os.getenv("DOSSIER_CACHE_TTL", str(7 * 24 * 3600)))
+# Least recently used entries are evicted once the stored text exceeds this
+DOSSIER_CACHE_MAX_MB = float(os.getenv("DOSSIER_CACHE_MAX_MB", "256"))
+# Entries dropped per eviction statement, so a full cache doesn't evict on every put
+DOSSIER_CACHE_EVICT_BATCH = int(os.getenv("DOSSIER_CACHE_EVICT_BATCH", "32"))
+
+TRACKING_PARAMS = {"fbclid", "gclid", "msclkid", "mc_cid", "mc_eid", "ref"}
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a lead URL, so trivial variants share one cache entry."""
+    url = url.strip()
+    if "://" not in url:
+        url = "https://" + url
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    port = parts.port
+    netloc = host if port in (None, 80, 443) else f"{host}:{port}"
+    path = parts.path.rstrip("/") or "/"
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not (key.lower().startswith("utm_") or key.lower() in TRACKING_PARAMS)
+    ))
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def cache_key(url: str, variant: str = "") -> str:
+    """`variant` separates differently-built dossiers of the same URL (e.g. crawled vs. landing page only)."""
+    key = normalize_url(url) + (f"#{variant}" if variant else "")
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class DossierCache:
+    """
+    On-disk SQLite store of extracted website text keyed by the hash of the
+    normalized URL. Keeps the origin's ETag/Last-Modified so stale entries can
+    be revalidated with a conditional GET instead of a full scrape. Every call
+    does blocking SQLite I/O, so async code calls it through asyncio.to_thread.
+    """
+
+    def __init__(
+        self,
+        path: str = DOSSIER_CACHE_PATH,
+        ttl: float = DOSSIER_CACHE_TTL,
+        max_bytes: int = int(DOSSIER_CACHE_MAX_MB * 1024 * 1024),
+    ):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        # Bytes of stored text, summed once on connect and kept up to date by put/_evict
+        self._total = 0
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        # Opened on first use (always under self._lock), so importing lib.dossier touches no files
+        if self._connection is None:
+            self._connection = self._connect()
+        return self._connection
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS dossiers (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                dossier TEXT NOT NULL,
+                is_qualified INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        db.execute("CREATE INDEX IF NOT EXISTS dossiers_accessed_at ON dossiers (accessed_at)")
+        self._total = db.execute("SELECT COALESCE(SUM(size), 0) FROM dossiers").fetchone()[0]
+        return db
+
+    def get(self, url: str, variant: str = "") -> Optional[dict]:
+        """Returns the entry (fresh or stale) with an `is_fresh` flag, or None."""
+        key = cache_key(url, variant)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT * FROM dossiers WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE dossiers SET accessed_at = ? WHERE key = ?", (now, key))
+        entry = dict(row)
+        entry["is_qualified"] = bool(entry["is_qualified"])
+        entry["is_fresh"] = now - entry["fetched_at"] < self.ttl
+        return entry
+
+    def put(
+        self,
+        url: str,
+        dossier: str,
+        is_qualified: bool,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        variant: str = "",
+    ):
+        now = time.time()
+        size = len(dossier.encode("utf-8"))
+        content_hash = hashlib.sha256(dossier.encode("utf-8")).hexdigest()
+        key = cache_key(url, variant)
+        with self._lock:
+            replaced = self._db.execute("SELECT size FROM dossiers WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO dossiers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, normalize_url(url), dossier, int(is_qualified), content_hash,
+                 etag, last_modified, now, now, size),
+            )
+            self._total += size - (replaced[0] if replaced else 0)
+            self._evict()
+
+    def mark_revalidated(self, url: str, variant: str = ""):
+        """The origin answered 304, so the stored text is good for another TTL."""
+        with self._lock:
+            self._db.execute("UPDATE dossiers SET fetched_at = ? WHERE key = ?", (time.time(), cache_key(url, variant)))
+
+    def _evict(self):
+        while self._total > self.max_bytes:
+            freed = self._db.execute(
+                "DELETE FROM dossiers WHERE key IN (SELECT key FROM dossiers ORDER BY accessed_at LIMIT ?) RETURNING size",
+                (DOSSIER_CACHE_EVICT_BATCH,),
+            ).fetchall()
+            if not freed:
+                self._total = 0
+                break
+            self._total -= sum(size for (size,) in freed)
@@ -0,0 +1,147 @@
+import os
+import re
+from html.parser import HTMLParser
+from typing import List, Tuple
+from playwright.async_api import Page
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- CONFIG ---
+# Dossier budget in tokens (estimated at 4 characters per token); text past it is dropped
+MAX_DOSSIER_TOKENS = int(os.getenv("MAX_DOSSIER_TOKENS", "100000"))
+# Characters pulled out of the browser per round trip
+EXTRACT_CHUNK_CHARS = int(os.getenv("EXTRACT_CHUNK_CHARS", "20000"))
+
+# Boilerplate containers whose text never makes it into a dossier
+SKIP_TAGS = {"head", "title", "script", "style", "noscript", "template", "svg", "iframe", "nav", "footer"}
+SKIP_ROLES = {"navigation", "contentinfo"}
+BLOCK_TAGS = {
+    "p", "div", "section", "article", "main", "header", "aside", "li", "ul", "ol", "dl", "dt", "dd",
+    "table", "tr", "td", "th", "h1", "h2", "h3", "h4", "h5", "h6", "br", "hr", "blockquote", "pre",
+    "form", "fieldset", "figure", "figcaption", "address",
+}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+
+def normalize_text(text: str) -> str:
+    """Collapses runs of spaces and blank lines left by markup."""
+    lines = (re.sub(r"[ \t\r\f\v\u00a0]+", " ", line).strip() for line in text.split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+class BudgetedTextExtractor(HTMLParser):
+    """
+    Incremental HTML-to-text parser. Feed it chunks as they arrive; it drops
+    boilerplate elements and stops collecting once `max_chars` is reached, so
+    memory stays bounded no matter how large the page is. With `max_links`
+    it also keeps the first hrefs it sees, navigation included.
+    """
+
+    def __init__(self, max_chars: int, max_links: int = 0):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.max_links = max_links
+        self.links: List[str] = []
+        self.parts: List[str] = []
+        self.length = 0
+        self.truncated = False
+        self._skipping: List[str] = []
+
+    @property
+    def full(self) -> bool:
+        return self.length >= self.max_chars
+
+    def _append(self, text: str):
+        if self.full:
+            self.truncated = True
+            return
+        room = self.max_chars - self.length
+        if len(text) > room:
+            text = text[:room]
+            self.truncated = True
+        self.parts.append(text)
+        self.length += len(text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a" and len(self.links) < self.max_links:
+            href = dict(attrs).get("href")
+            if href:
+                self.links.append(href)
+        if self._skipping:
+            if tag == self._skipping[-1] and tag not in VOID_TAGS:
+                self._skipping.append(tag)
+            return
+        if tag in SKIP_TAGS or dict(attrs).get("role") in SKIP_ROLES:
+            if tag not in VOID_TAGS:
+                self._skipping.append(tag)
+            return
+        if tag in BLOCK_TAGS:
+            self._append("\n")
+
+    def handle_endtag(self, tag):
+        if self._skipping:
+            if tag == self._skipping[-1]:
+                self._skipping.pop()
+            return
+        if tag in BLOCK_TAGS:
+            self._append("\n")
+
+    def handle_data(self, data):
+        if not self._skipping and data.strip():
+            self._append(data)
+
+    def text(self) -> str:
+        return normalize_text("".join(self.parts))
+
+
+# Walks the live DOM with a TreeWalker kept on window, returning at most chunkChars per call
+_DOM_TEXT_CHUNK_JS = """
+([chunkChars, skipTags, skipRoles, blockTags]) => {
+    if (!window.__edinburghWalker) {
+        const skip = new Set(skipTags), roles = new Set(skipRoles), blocks = new Set(blockTags);
+        window.__edinburghWalker = document.createTreeWalker(
+            document.body || document.documentElement,
+            NodeFilter.SHOW_ELEMENT | NodeFilter.SHOW_TEXT,
+            { acceptNode(node) {
+                if (node.nodeType === Node.TEXT_NODE) return NodeFilter.FILTER_ACCEPT;
+                const tag = node.tagName.toLowerCase();
+                if (skip.has(tag) || roles.has(node.getAttribute("role"))) return NodeFilter.FILTER_REJECT;
+                return blocks.has(tag) ? NodeFilter.FILTER_ACCEPT : NodeFilter.FILTER_SKIP;
+            } }
+        );
+    }
+    const walker = window.__edinburghWalker;
+    let out = "", node = null;
+    while (out.length < chunkChars && (node = walker.nextNode())) {
+        out += node.nodeType === Node.TEXT_NODE ? node.nodeValue : "\\n";
+    }
+    return { text: out, done: node === null };
+}
+"""
+
+
+async def extract_text_from_page(page: Page, max_tokens: int = MAX_DOSSIER_TOKENS) -> Tuple[str, bool]:
+    """
+    Pulls the rendered page text out of the browser chunk by chunk and stops at
+    the token budget, instead of serializing the whole body HTML at once.
+    """
+    max_chars = max_tokens * 4
+    parts: List[str] = []
+    length = 0
+    truncated = False
+    args = [EXTRACT_CHUNK_CHARS, sorted(SKIP_TAGS), sorted(SKIP_ROLES), sorted(BLOCK_TAGS)]
+    while True:
+        chunk = await page.evaluate(_DOM_TEXT_CHUNK_JS, args)
+        parts.append(chunk["text"])
+        length += len(chunk["text"])
+        if length >= max_chars:
+            truncated = not chunk["done"] or length > max_chars
+            break
+        if chunk["done"]:
+            break
+    text = normalize_text("".join(parts))
+    if len(text) > max_chars:
+        text = text[:max_chars]
+        truncated = True
+    return text, truncated
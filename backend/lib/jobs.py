@@ -0,0 +1,287 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Optional
+from pydantic import BaseModel
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- CONFIG ---
+# "sqlite" (single host, default) or "redis" (workers on several hosts, needs the redis package)
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "sqlite")
+JOB_QUEUE_PATH = os.getenv(
+    "JOB_QUEUE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "jobs.sqlite3"),
+)
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# A running job not finished this long after it was claimed is handed to another worker
+# (or failed, once it has used up JOB_MAX_ATTEMPTS), e.g. because its worker died
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+# Workers give up on a job after this long, well inside the lease, so a slow job is
+# failed by its own worker before anyone else can claim it
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", str(JOB_LEASE_SECONDS * 0.8)))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+FINISHED_STATUSES = ("done", "failed")
+
+
+class Job(BaseModel):
+    id: str
+    kind: str
+    status: str  # queued, running, done, failed
+    payload: dict
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    worker: Optional[str] = None
+    created_at: float
+    updated_at: float
+
+
+class SQLiteJobQueue:
+    """Durable job queue in a local SQLite file, shared by the API and worker processes on one host."""
+
+    def __init__(self, path: str = JOB_QUEUE_PATH):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                lease_expires_at REAL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+
+    def _to_job(self, row) -> Job:
+        return Job(
+            id=row["id"],
+            kind=row["kind"],
+            status=row["status"],
+            payload=json.loads(row["payload"]),
+            result=json.loads(row["result"]) if row["result"] else None,
+            error=row["error"],
+            attempts=row["attempts"],
+            worker=row["worker"],
+            created_at=row["created_at"],
+            updated_at=row["updated_at"],
+        )
+
+    def submit(self, kind: str, payload: dict) -> Job:
+        now = time.time()
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, status, payload, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), now, now),
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_job(row) if row else None
+
+    def claim(
+        self, worker: str, lease_seconds: float = JOB_LEASE_SECONDS, max_attempts: int = JOB_MAX_ATTEMPTS
+    ) -> Optional[Job]:
+        """
+        Takes the oldest queued job, or one whose worker's lease ran out. A job
+        whose lease ran out on its last attempt is failed instead, so a job that
+        kills or hangs its worker is not retried forever.
+        """
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two processes never claim the same row
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    """
+                    UPDATE jobs SET status = 'failed', lease_expires_at = NULL, updated_at = ?,
+                        error = 'Lease expired on attempt ' || attempts || ', giving up'
+                    WHERE status = 'running' AND lease_expires_at < ? AND attempts >= ?
+                    """,
+                    (now, now, max_attempts),
+                )
+                row = self._db.execute(
+                    """
+                    SELECT id FROM jobs
+                    WHERE status = 'queued' OR (status = 'running' AND lease_expires_at < ?)
+                    ORDER BY created_at LIMIT 1
+                    """,
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    self._db.execute("COMMIT")
+                    return None
+                self._db.execute(
+                    """
+                    UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1,
+                        lease_expires_at = ?, updated_at = ?
+                    WHERE id = ?
+                    """,
+                    (worker, now + lease_seconds, now, row["id"]),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return self.get(row["id"])
+
+    def complete(self, job_id: str, worker: str, result: Any) -> bool:
+        """Stores the result if `worker` still holds the job; False when its lease was lost."""
+        with self._lock:
+            cursor = self._db.execute(
+                """
+                UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_expires_at = NULL, updated_at = ?
+                WHERE id = ? AND worker = ? AND status = 'running'
+                """,
+                (json.dumps(result), time.time(), job_id, worker),
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: str, worker: str, error: str, max_attempts: int = JOB_MAX_ATTEMPTS) -> bool:
+        """
+        Re-queues the job until it has used up `max_attempts`, then marks it failed.
+        Like complete(), only while `worker` still holds it.
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                """
+                UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+                    error = ?, lease_expires_at = NULL, updated_at = ?
+                WHERE id = ? AND worker = ? AND status = 'running'
+                """,
+                (max_attempts, error, time.time(), job_id, worker),
+            )
+        return cursor.rowcount == 1
+
+
+# ARGV: worker, now, lease_seconds, max_attempts. Hands expired leases back to the
+# queue (or fails them on their last attempt), then moves the oldest queued job to running.
+_CLAIM_SCRIPT = """
+local now = tonumber(ARGV[2])
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', 'jobs:leases', 0, now)) do
+    redis.call('ZREM', 'jobs:leases', id)
+    redis.call('LREM', 'jobs:running', 1, id)
+    local attempts = tonumber(redis.call('HGET', 'job:' .. id, 'attempts') or '0')
+    if attempts >= tonumber(ARGV[4]) then
+        redis.call('HSET', 'job:' .. id, 'status', 'failed', 'updated_at', now,
+            'error', 'Lease expired on attempt ' .. attempts .. ', giving up')
+    else
+        redis.call('HSET', 'job:' .. id, 'status', 'queued', 'updated_at', now)
+        redis.call('RPUSH', 'jobs:queued', id)
+    end
+end
+local id = redis.call('LMOVE', 'jobs:queued', 'jobs:running', 'RIGHT', 'LEFT')
+if not id then
+    return false
+end
+redis.call('ZADD', 'jobs:leases', now + tonumber(ARGV[3]), id)
+redis.call('HSET', 'job:' .. id, 'status', 'running', 'worker', ARGV[1], 'updated_at', now)
+redis.call('HINCRBY', 'job:' .. id, 'attempts', 1)
+return id
+"""
+
+# ARGV: job_id, worker, now, status ("done" or "failed"), result, error, max_attempts.
+# Does nothing and returns 0 unless `worker` still holds the job.
+_FINISH_SCRIPT = """
+local job = 'job:' .. ARGV[1]
+if redis.call('HGET', job, 'status') ~= 'running' or redis.call('HGET', job, 'worker') ~= ARGV[2] then
+    return 0
+end
+redis.call('ZREM', 'jobs:leases', ARGV[1])
+redis.call('LREM', 'jobs:running', 1, ARGV[1])
+local status = ARGV[4]
+if status == 'done' then
+    redis.call('HSET', job, 'result', ARGV[5])
+elseif tonumber(redis.call('HGET', job, 'attempts') or '0') < tonumber(ARGV[7]) then
+    status = 'queued'
+    redis.call('RPUSH', 'jobs:queued', ARGV[1])
+end
+redis.call('HSET', job, 'status', status, 'error', ARGV[6], 'updated_at', ARGV[3])
+return 1
+"""
+
+
+class RedisJobQueue:
+    """
+    Same contract as SQLiteJobQueue on Redis, for scraper workers on other hosts.
+    Jobs are hashes, the queue is a list, and running leases live in a sorted set.
+    """
+
+    def __init__(self, url: str = REDIS_URL):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("JOB_QUEUE_BACKEND=redis needs the redis package (pip install redis)")
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        # Each runs atomically on the server, so a worker dying halfway never strands a job
+        self._claim = self._redis.register_script(_CLAIM_SCRIPT)
+        self._finish = self._redis.register_script(_FINISH_SCRIPT)
+
+    def _to_job(self, data: dict) -> Job:
+        return Job(
+            id=data["id"],
+            kind=data["kind"],
+            status=data["status"],
+            payload=json.loads(data["payload"]),
+            result=json.loads(data["result"]) if data.get("result") else None,
+            error=data.get("error") or None,
+            attempts=int(data.get("attempts", 0)),
+            worker=data.get("worker") or None,
+            created_at=float(data["created_at"]),
+            updated_at=float(data["updated_at"]),
+        )
+
+    def submit(self, kind: str, payload: dict) -> Job:
+        now = time.time()
+        job_id = str(uuid.uuid4())
+        pipe = self._redis.pipeline()
+        pipe.hset(f"job:{job_id}", mapping={
+            "id": job_id, "kind": kind, "status": "queued", "payload": json.dumps(payload),
+            "attempts": 0, "created_at": now, "updated_at": now,
+        })
+        pipe.lpush("jobs:queued", job_id)
+        pipe.execute()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        data = self._redis.hgetall(f"job:{job_id}")
+        return self._to_job(data) if data else None
+
+    def claim(
+        self, worker: str, lease_seconds: float = JOB_LEASE_SECONDS, max_attempts: int = JOB_MAX_ATTEMPTS
+    ) -> Optional[Job]:
+        job_id = self._claim(args=[worker, time.time(), lease_seconds, max_attempts])
+        return self.get(job_id) if job_id else None
+
+    def complete(self, job_id: str, worker: str, result: Any) -> bool:
+        return bool(self._finish(args=[job_id, worker, time.time(), "done", json.dumps(result), "", 0]))
+
+    def fail(self, job_id: str, worker: str, error: str, max_attempts: int = JOB_MAX_ATTEMPTS) -> bool:
+        return bool(self._finish(args=[job_id, worker, time.time(), "failed", "", error, max_attempts]))
+
+
+_job_queue = None
+
+def get_job_queue():
+    """The process-wide queue for the configured JOB_QUEUE_BACKEND."""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = RedisJobQueue() if JOB_QUEUE_BACKEND == "redis" else SQLiteJobQueue()
+    return _job_queue
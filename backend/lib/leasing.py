@@ -0,0 +1,115 @@
+import os
+import socket
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional, Tuple
+from pydantic import BaseModel
+from supabase import Client
+from dotenv import load_dotenv
+from lib.dispatch import DISPATCH_MAX_SECONDS
+
+load_dotenv()
+
+# --- CONFIG ---
+# Claim/release are Postgres functions, see sql/scheduled_emails_leasing.sql
+CLAIM_BATCH_SIZE = int(os.getenv("CLAIM_BATCH_SIZE", "100"))
+# Must outlive a whole dispatch run, or another worker could re-claim rows still being sent
+LEASE_SECONDS = int(os.getenv("LEASE_SECONDS", str(int(DISPATCH_MAX_SECONDS) + 300)))
+WORKER_ID = os.getenv("WORKER_ID", f"{socket.gethostname()}-{os.getpid()}")
+
+# Everything sending a row needs; lease bookkeeping and any other columns stay in the database.
+# body_text is left out, rows with a stored payload don't need it (see claim_batch)
+SEND_COLUMNS = "id,recipient,subject,sender_name,mailbox,scheduled_time,mime_payload,mime_hash"
+
+
+class Lease(BaseModel):
+    token: str
+    owner: str
+    expires_at: datetime
+    rows: List[dict] = []
+
+    @property
+    def ids(self) -> List[int]:
+        return [row["id"] for row in self.rows]
+
+    @property
+    def cursor(self) -> Optional[Tuple[str, int]]:
+        """(scheduled_time, id) of the last row, where the next page of the same run starts."""
+        if not self.rows:
+            return None
+        return self.rows[-1]["scheduled_time"], self.rows[-1]["id"]
+
+
+def claim_batch(
+    supabase: Client,
+    window_start: datetime,
+    window_end: datetime,
+    limit: int = CLAIM_BATCH_SIZE,
+    lease_seconds: int = LEASE_SECONDS,
+    after: Optional[Tuple[str, int]] = None,
+) -> Lease:
+    """
+    Atomically claims up to `limit` unsent rows scheduled inside the window, oldest
+    first. Rows held by another live lease are skipped; expired leases are claimable
+    again. `after` is the previous page's Lease.cursor: rows at or before it are
+    skipped, so rows released earlier in the same run are not claimed twice.
+    """
+    token = str(uuid.uuid4())
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)
+    response = supabase.rpc("claim_scheduled_emails", {
+        "p_token": token,
+        "p_owner": WORKER_ID,
+        "p_window_start": window_start.isoformat(),
+        "p_window_end": window_end.isoformat(),
+        "p_limit": limit,
+        "p_lease_seconds": lease_seconds,
+        "p_after_time": after[0] if after else None,
+        "p_after_id": after[1] if after else None,
+    }).select(SEND_COLUMNS).execute()
+    # Row ids are unique, but never trust a retried RPC to not hand back duplicates
+    rows, seen = [], set()
+    for row in response.data or []:
+        if row["id"] not in seen:
+            seen.add(row["id"])
+            rows.append(row)
+    # Only rows without a stored payload are rendered now, and only they need their body
+    unrendered = [row["id"] for row in rows if not row.get("mime_payload")]
+    if unrendered:
+        bodies = (
+            supabase.table("scheduled-emails")
+            .select("id,body_text")
+            .in_("id", unrendered)
+            .execute()
+        ).data or []
+        body_by_id = {body["id"]: body["body_text"] for body in bodies}
+        for row in rows:
+            if row["id"] in body_by_id:
+                row["body_text"] = body_by_id[row["id"]]
+    # UPDATE ... RETURNING does not keep the subquery's order
+    rows.sort(key=lambda row: (datetime.fromisoformat(row["scheduled_time"]), row["id"]))
+    return Lease(token=token, owner=WORKER_ID, expires_at=expires_at, rows=rows)
+
+
+def release(supabase: Client, lease: Lease, ids: List[int]):
+    """Hands rows this lease still owns back to the queue ahead of lease expiry."""
+    if not ids:
+        return
+    supabase.rpc("release_scheduled_emails", {"p_token": lease.token, "p_ids": ids}).execute()
+
+
+def fail(supabase: Client, lease: Lease, errors: Dict[int, str]):
+    """
+    Takes rows this lease owns out of the queue for good, with the reason in
+    send_error; sending them again could never succeed (or could send twice).
+    """
+    by_error: Dict[str, List[int]] = {}
+    for row_id, error in errors.items():
+        by_error.setdefault(error, []).append(row_id)
+    for error, ids in by_error.items():
+        (
+            supabase.table("scheduled-emails")
+            .update({"send_error": error, "lease_token": None, "lease_owner": None, "lease_expires_at": None})
+            .eq("lease_token", lease.token)
+            .in_("id", ids)
+            .execute()
+        )
@@ -0,0 +1,222 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+from dotenv import load_dotenv
+from lib.clients import get_apify
+
+load_dotenv()
+
+# --- CONFIG ---
+# Off by default: leads are then written up from their website alone
+LINKEDIN_ENABLED = os.getenv("LINKEDIN_ENABLED", "false").lower() == "true"
+LINKEDIN_ACTOR = os.getenv("LINKEDIN_ACTOR", "supreme_coder/linkedin-post")
+LINKEDIN_POSTS_PER_PROFILE = int(os.getenv("LINKEDIN_POSTS_PER_PROFILE", "3"))
+LINKEDIN_POST_MAX_CHARS = int(os.getenv("LINKEDIN_POST_MAX_CHARS", "600"))
+# Profiles requested within one window share an actor run, up to LINKEDIN_BATCH_SIZE per run
+LINKEDIN_BATCH_SIZE = int(os.getenv("LINKEDIN_BATCH_SIZE", "25"))
+LINKEDIN_BATCH_WINDOW_MS = float(os.getenv("LINKEDIN_BATCH_WINDOW_MS", "250"))
+# Actor runs in flight at once; every run holds Apify memory until it finishes
+LINKEDIN_MAX_RUNS = int(os.getenv("LINKEDIN_MAX_RUNS", "2"))
+LINKEDIN_RUN_TIMEOUT = int(os.getenv("LINKEDIN_RUN_TIMEOUT", "300"))
+# How long email generation waits for posts that are not cached yet. With 0 only
+# cached posts are used, and the run started for this lead fills the cache for the next one
+LINKEDIN_WAIT_SECONDS = float(os.getenv("LINKEDIN_WAIT_SECONDS", "0"))
+LINKEDIN_CACHE_PATH = os.getenv(
+    "LINKEDIN_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "linkedin-cache.sqlite3"),
+)
+LINKEDIN_CACHE_TTL = float(os.getenv("LINKEDIN_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Dataset fields that name the profile a post was scraped for
+SOURCE_FIELDS = ("inputUrl", "authorProfileUrl", "profileUrl")
+
+
+def profile_key(url: str) -> str:
+    """linkedin.com/in/<slug>, whatever scheme, subdomain, query or trailing slash the URL came with."""
+    url = url.strip()
+    parts = urlsplit(url if "://" in url else "https://" + url)
+    host = (parts.hostname or "").lower()
+    if host.endswith("linkedin.com"):
+        host = "linkedin.com"
+    return f"{host}{parts.path.rstrip('/').lower()}"
+
+
+class PostCache:
+    """SQLite store of each profile's recent posts, keyed by profile_key."""
+
+    def __init__(self, path: str = LINKEDIN_CACHE_PATH, ttl: float = LINKEDIN_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        # Opened on the first lookup (under self._lock) rather than at import
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS posts (key TEXT PRIMARY KEY, posts TEXT NOT NULL, fetched_at REAL NOT NULL)"
+            )
+        return self._connection
+
+    def get(self, key: str) -> Optional[List[str]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT posts FROM posts WHERE key = ? AND fetched_at > ?", (key, time.time() - self.ttl)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_many(self, posts: Dict[str, List[str]]):
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO posts VALUES (?, ?, ?)",
+                [(key, json.dumps(items), now) for key, items in posts.items()],
+            )
+
+
+class LinkedInEnricher:
+    """
+    Fetches recent LinkedIn posts through the Apify actor without blocking the
+    caller. Profiles asked for close together go into one actor run, a profile
+    already being fetched is never fetched twice, and results are cached.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[PostCache] = None,
+        enabled: bool = LINKEDIN_ENABLED,
+        batch_size: int = LINKEDIN_BATCH_SIZE,
+        batch_window: float = LINKEDIN_BATCH_WINDOW_MS / 1000,
+        max_runs: int = LINKEDIN_MAX_RUNS,
+    ):
+        self.cache = cache
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._queued: Dict[str, str] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._runs: set = set()
+        self._semaphore = asyncio.Semaphore(max_runs)
+
+    async def request(self, url: Optional[str]) -> Optional[asyncio.Future]:
+        """
+        Starts fetching a profile's posts and returns a future of them; already
+        resolved when they were cached. None when enrichment is off or there is no URL.
+        """
+        if not self.enabled or not url:
+            return None
+        key = profile_key(url)
+        if key not in self._in_flight:
+            cached = await asyncio.to_thread(self.cache.get, key) if self.cache else None
+            future = asyncio.get_running_loop().create_future()
+            if cached is not None:
+                future.set_result(cached)
+                return future
+            # Someone may have queued the profile while the cache was being read
+            if key in self._in_flight:
+                return self._in_flight[key]
+            self._in_flight[key] = future
+            self._queued[key] = url
+            if len(self._queued) >= self.batch_size:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self._flush)
+        return self._in_flight[key]
+
+    async def prefetch(self, urls: Iterable[Optional[str]]):
+        """Queues every profile at once and starts the runs right away, for batch requests."""
+        for url in urls:
+            await self.request(url)
+        self._flush()
+
+    async def posts(self, future: Optional[asyncio.Future], wait: float = LINKEDIN_WAIT_SECONDS) -> List[str]:
+        """The posts if they are in within `wait` seconds, otherwise none; the run carries on regardless."""
+        if future is None:
+            return []
+        if not future.done() and wait > 0:
+            try:
+                await asyncio.wait_for(asyncio.shield(future), wait)
+            except asyncio.TimeoutError:
+                pass
+        return future.result() if future.done() else []
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        while self._queued:
+            keys = list(self._queued)[:self.batch_size]
+            batch = {key: self._queued.pop(key) for key in keys}
+            task = asyncio.create_task(self._run(batch))
+            self._runs.add(task)
+            task.add_done_callback(self._runs.discard)
+
+    async def _run(self, batch: Dict[str, str]):
+        posts: Dict[str, List[str]] = {key: [] for key in batch}
+        try:
+            async with self._semaphore:
+                started = time.perf_counter()
+                apify = await asyncio.to_thread(get_apify)
+                run = await apify.actor(LINKEDIN_ACTOR).call(
+                    run_input={
+                        "deepScrape": False,
+                        "limitPerSource": LINKEDIN_POSTS_PER_PROFILE,
+                        "rawData": False,
+                        "urls": list(batch.values()),
+                    },
+                    wait_secs=LINKEDIN_RUN_TIMEOUT,
+                    # Only wait on the run; streaming the actor's log costs extra API calls per run
+                    logger=None,
+                )
+                if not run or run.get("status") != "SUCCEEDED":
+                    raise RuntimeError(f"actor run ended as {run.get('status') if run else 'unknown'}")
+                items = (await apify.dataset(run["defaultDatasetId"]).list_items()).items
+            matched = set()
+            for item in items:
+                source = next((item[field] for field in SOURCE_FIELDS if item.get(field)), None)
+                # A single-profile run can only be about that profile
+                key = profile_key(source) if source else (next(iter(batch)) if len(batch) == 1 else None)
+                if key not in posts:
+                    continue
+                matched.add(key)
+                text = (item.get("text") or "").strip()
+                if text and len(posts[key]) < LINKEDIN_POSTS_PER_PROFILE:
+                    posts[key].append(text[:LINKEDIN_POST_MAX_CHARS])
+            if self.cache:
+                # In a shared run, a profile no item maps back to may just be one whose items lack
+                # the source URL, so it isn't cached as having no posts; a single-profile run is conclusive
+                cacheable = posts if len(batch) == 1 else {key: posts[key] for key in matched}
+                if cacheable:
+                    await asyncio.to_thread(self.cache.put_many, cacheable)
+            print(
+                f"[*] LinkedIn: {sum(map(len, posts.values()))} post(s) for {len(batch)} profile(s) "
+                f"in one actor run ({time.perf_counter() - started:.1f}s)"
+            )
+        except Exception as e:
+            # Not cached, so the next request for these profiles tries again
+            print(f"Error extracting LinkedIn posts for {len(batch)} profile(s): {e}")
+        finally:
+            for key in batch:
+                future = self._in_flight.pop(key, None)
+                if future is not None and not future.done():
+                    future.set_result(posts[key])
+
+    async def close(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        for task in list(self._runs):
+            task.cancel()
+        await asyncio.gather(*self._runs, return_exceptions=True)
+
+
+linkedin = LinkedInEnricher(cache=PostCache())
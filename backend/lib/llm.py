@@ -0,0 +1,182 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING, Optional, Type, TypeVar
+import httpx
+from pydantic import BaseModel
+from lib.metrics import timed, LLM_CALL_SECONDS, LLM_EVENTS
+from lib.clients import get_settings
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+load_dotenv()
+
+# --- CONFIG ---
+# Off by default: generateCustomEmail then fills the manual template without calling the model
+LLM_ENABLED = os.getenv("LLM_ENABLED", "false").lower() == "true"
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-5-nano")
+# Point at bench/stub_llm.py (e.g. http://localhost:8090/v1) to run without OpenAI
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or None
+# Requests in flight at once; also the size of the keep-alive connection pool
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+# Bump whenever the prompts change, so cached responses from the old prompts are not reused
+PROMPT_VERSION = os.getenv("PROMPT_VERSION", "1")
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "llm-cache.sqlite3"),
+)
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600)))
+
+# Status codes worth another attempt; everything else is the request's own fault
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+T = TypeVar("T", bound=BaseModel)
+
+
+def response_cache_key(dossier: dict, model: str = LLM_MODEL, prompt_version: str = PROMPT_VERSION) -> str:
+    """Hash of the dossier content plus the prompt version and model that turn it into an email."""
+    content = json.dumps(dossier, sort_keys=True, default=str)
+    return hashlib.sha256(f"{prompt_version}\0{model}\0{content}".encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite store of raw model outputs keyed by response_cache_key."""
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        # Opened on the first lookup (under self._lock) rather than at import
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+        return self._connection
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response FROM responses WHERE key = ? AND created_at > ?", (key, time.time() - self.ttl)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, response: str):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, response, time.time()))
+
+
+class LLMClient:
+    """
+    One AsyncOpenAI client shared by every request, with a bounded keep-alive
+    pool, a concurrency limit, retries with exponential backoff on transient
+    errors, and an optional response cache.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = LLM_BASE_URL,
+        model: str = LLM_MODEL,
+        concurrency: int = LLM_CONCURRENCY,
+        max_retries: int = LLM_MAX_RETRIES,
+        cache: Optional[ResponseCache] = None,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.cache = cache
+        self._client: Optional["AsyncOpenAI"] = None
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    @property
+    def client(self) -> "AsyncOpenAI":
+        if self._client is None:
+            # Imported here: the SDK takes longer to import than the rest of the API, and
+            # with LLM_ENABLED off (template emails) it is never needed
+            from openai import AsyncOpenAI
+            http_client = httpx.AsyncClient(
+                timeout=LLM_TIMEOUT,
+                limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+            )
+            # Retries are ours, so the backoff and the stats see every attempt
+            self._client = AsyncOpenAI(
+                api_key=self.api_key or get_settings().openai_api_key or "unset",
+                base_url=self.base_url,
+                max_retries=0,
+                http_client=http_client,
+            )
+        return self._client
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        from openai import APIStatusError
+        if isinstance(error, APIStatusError):
+            retry_after = error.response.headers.get("retry-after")
+            if retry_after and retry_after.replace(".", "", 1).isdigit():
+                return min(float(retry_after), LLM_BACKOFF_MAX)
+        # Full jitter, so clients that failed together don't retry together
+        return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+    async def parse(self, text_format: Type[T], system_prompt: str, prompt: str, cache_key: Optional[str] = None) -> T:
+        """Structured response parsed into `text_format`, from the cache when `cache_key` was seen before."""
+        if self.cache and cache_key:
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                LLM_EVENTS.labels(event="cache_hit").inc()
+                return text_format.model_validate_json(cached)
+        from openai import APIConnectionError, APIStatusError, RateLimitError
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    with timed(LLM_CALL_SECONDS, "llm.call", outcome="ok"):
+                        response = await self.client.responses.parse(
+                            model=self.model,
+                            text_format=text_format,
+                            input=[
+                                {"role": "system", "content": system_prompt},
+                                {"role": "user", "content": prompt},
+                            ],
+                        )
+                break
+            except (APIConnectionError, RateLimitError, APIStatusError) as e:
+                retryable = isinstance(e, APIConnectionError) or e.status_code in RETRYABLE_STATUS
+                if not retryable or attempt >= self.max_retries:
+                    LLM_EVENTS.labels(event="failure").inc()
+                    raise
+                delay = self._backoff(attempt, e)
+                attempt += 1
+                LLM_EVENTS.labels(event="retry").inc()
+                print(f"LLM call failed ({e.__class__.__name__}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+        parsed = response.output_parsed
+        if self.cache and cache_key:
+            await asyncio.to_thread(self.cache.put, cache_key, parsed.model_dump_json())
+        return parsed
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+llm = LLMClient(cache=ResponseCache() if LLM_CACHE_ENABLED else None)
@@ -0,0 +1,111 @@
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Optional
+from prometheus_client import Counter, Histogram, REGISTRY
+from prometheus_client.core import GaugeMetricFamily
+from dotenv import load_dotenv
+
+try:
+    from opentelemetry import trace
+except ImportError:  # Spans are then skipped; the Prometheus metrics work either way
+    trace = None
+
+load_dotenv()
+
+# --- CONFIG ---
+# Spans go to whatever tracer provider is configured (e.g. by `opentelemetry-instrument`
+# with the usual OTEL_* variables); without opentelemetry installed this does nothing
+OTEL_ENABLED = os.getenv("OTEL_ENABLED", "false").lower() == "true"
+
+_tracer = trace.get_tracer("edinburgh") if trace is not None and OTEL_ENABLED else None
+
+# Scrapes take seconds, SMTP and database calls tens of milliseconds
+_SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+_FAST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+SCRAPE_SECONDS = Histogram(
+    "edinburgh_scrape_seconds", "Whole extract_info_from_website call", ["tier", "outcome"], buckets=_SLOW_BUCKETS
+)
+SCRAPE_STAGE_SECONDS = Histogram(
+    "edinburgh_scrape_stage_seconds",
+    "Scrape stages: cache_lookup, revalidate, http_fetch, navigation, dom_extraction, crawl, qualification",
+    ["stage"],
+    buckets=_SLOW_BUCKETS,
+)
+GENERATE_SECONDS = Histogram(
+    "edinburgh_generate_seconds", "generateCustomEmail", ["mode", "outcome"], buckets=_SLOW_BUCKETS
+)
+LLM_CALL_SECONDS = Histogram(
+    "edinburgh_llm_call_seconds", "One model request attempt", ["outcome"], buckets=_SLOW_BUCKETS
+)
+LLM_EVENTS = Counter("edinburgh_llm_events_total", "LLM cache hits, retries and failures", ["event"])
+DOSSIER_COMPRESSIONS = Counter("edinburgh_prompt_dossiers_total", "Website texts fitted into the prompt token budget")
+DOSSIER_TOKENS = Counter(
+    "edinburgh_prompt_dossier_tokens_total", "Website text tokens before and after fitting the budget", ["stage"]
+)
+SMTP_PHASE_SECONDS = Histogram(
+    "edinburgh_smtp_phase_seconds",
+    "SMTP phases: render, connect, ehlo, starttls, login, noop, sendmail",
+    ["phase"],
+    buckets=_FAST_BUCKETS,
+)
+EMAILS_TOTAL = Counter("edinburgh_emails_total", "Scheduled sends per mailbox", ["mailbox", "outcome"])
+SUPABASE_SECONDS = Histogram(
+    "edinburgh_supabase_seconds", "Supabase calls made by the send cron", ["operation"], buckets=_FAST_BUCKETS
+)
+
+
+@contextmanager
+def timed(histogram: Histogram, span: Optional[str] = None, **labels):
+    """
+    Observes the wall time of the block (awaits included) in `histogram`, and
+    wraps it in an OpenTelemetry span named `span` when tracing is enabled.
+    An `outcome` label is switched to "error" when the block raises.
+    """
+    started = time.perf_counter()
+    with _tracer.start_as_current_span(span, attributes=labels) if _tracer is not None and span else nullcontext():
+        try:
+            yield
+        except Exception:
+            if "outcome" in labels:
+                labels["outcome"] = "error"
+            raise
+        finally:
+            histogram.labels(**labels).observe(time.perf_counter() - started)
+
+
+class _BrowserPoolCollector:
+    """Reads the browser pool's stats() at scrape time, so the gauges are never stale."""
+
+    def __init__(self, stats: Callable[[], dict]):
+        self.stats = stats
+
+    def collect(self):
+        gauges = {
+            name: GaugeMetricFamily(f"edinburgh_browser_contexts_{name}", f"Browser contexts {name}", labels=["browser"])
+            for name in ("idle", "in_use", "waiting")
+        }
+        pages = GaugeMetricFamily("edinburgh_browser_pages_served", "Pages served since launch", labels=["browser"])
+        rss = GaugeMetricFamily("edinburgh_browser_rss_mb", "Chromium memory at the last health check", labels=["browser"])
+        for browser in self.stats().get("browsers", []):
+            index = str(browser["index"])
+            for name, gauge in gauges.items():
+                gauge.add_metric([index], (browser["pool"] or {}).get(name, 0))
+            pages.add_metric([index], browser["pages_served"])
+            if browser["rss_mb"] is not None:
+                rss.add_metric([index], browser["rss_mb"])
+        yield from gauges.values()
+        yield pages
+        yield rss
+
+
+_browser_collector: Optional[_BrowserPoolCollector] = None
+
+def register_browser_pool(stats: Callable[[], dict]):
+    """Exports a BrowserManager's stats() as gauges; calling it again replaces the previous pool."""
+    global _browser_collector
+    if _browser_collector is not None:
+        REGISTRY.unregister(_browser_collector)
+    _browser_collector = _BrowserPoolCollector(stats)
+    REGISTRY.register(_browser_collector)
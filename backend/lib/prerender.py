@@ -0,0 +1,85 @@
+import email
+import email.policy
+import hashlib
+import os
+from typing import List, Optional
+from supabase import Client
+from dotenv import load_dotenv
+from lib import send_email_func
+from lib.clients import get_supabase
+
+load_dotenv()
+
+# --- CONFIG ---
+# Rows rendered per call of prerender_pending; the columns come from sql/scheduled_emails_prerender.sql
+PRERENDER_BATCH_SIZE = int(os.getenv("PRERENDER_BATCH_SIZE", "200"))
+
+PAYLOAD_COLUMNS = "id,recipient,subject,body_text,sender_name,mailbox"
+
+
+def _fields(record: dict) -> tuple:
+    # Same defaults cron.send_email applies, so a stored payload matches what it would build
+    return (
+        record.get("recipient"),
+        record.get("subject", "No Subject"),
+        record.get("body_text", "No Content"),
+        record.get("sender_name", "No Content"),
+        record.get("mailbox"),
+    )
+
+
+def payload_hash(record: dict) -> str:
+    """Fingerprint of the fields a payload is built from, to catch rows edited after rendering."""
+    return hashlib.sha256("\0".join(str(field) for field in _fields(record)).encode("utf-8")).hexdigest()
+
+
+def render(record: dict) -> bytes:
+    to_address, subject, body_text, sender_name, mailbox = _fields(record)
+    return send_email_func.build_payload(to_address, subject, body_text, sender_name, mailbox)
+
+
+def payload_for(record: dict) -> bytes:
+    """The stored payload when it still matches the row, otherwise a freshly built one."""
+    stored = record.get("mime_payload")
+    # Claimed rows come without body_text when they have a payload; edits clear it
+    # in the database (sql/scheduled_emails_prerender.sql), so it can't be stale
+    if stored and ("body_text" not in record or record.get("mime_hash") == payload_hash(record)):
+        return stored.encode("ascii")
+    return render(record)
+
+
+def body_text(record: dict) -> Optional[str]:
+    """The row's body_text, read back from its stored payload when the row came without it."""
+    if "body_text" in record or not record.get("mime_payload"):
+        return record.get("body_text")
+    message = email.message_from_string(record["mime_payload"], policy=email.policy.default)
+    return message.get_body(preferencelist=("plain",)).get_content().replace("\r\n", "\n")
+
+
+def prerender_pending(supabase: Optional[Client] = None, limit: int = PRERENDER_BATCH_SIZE) -> int:
+    """Renders and stores the payload of unsent rows that don't have one yet; returns how many."""
+    supabase = supabase or get_supabase()
+    response = (
+        supabase.table("scheduled-emails")
+        .select(PAYLOAD_COLUMNS)
+        .eq("sent", False)
+        .is_("mime_payload", "null")
+        .not_.is_("mailbox", "null")
+        .not_.is_("recipient", "null")
+        .order("scheduled_time")
+        .limit(limit)
+        .execute()
+    )
+    rows: List[dict] = response.data or []
+    for row in rows:
+        # The generator only emits ASCII (headers RFC 2047, bodies quoted-printable)
+        payload = render(row).decode("ascii")
+        (
+            supabase.table("scheduled-emails")
+            .update({"mime_payload": payload, "mime_hash": payload_hash(row)})
+            .eq("id", row["id"])
+            .execute()
+        )
+    if rows:
+        print(f"[*] Pre-rendered {len(rows)} scheduled email(s)")
+    return len(rows)
@@ -0,0 +1,70 @@
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Tuple
+from pydantic import BaseModel
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- CONFIG ---
+# Weighted terms per campaign, e.g. {"default": {"audit*": 1, "seo agency": 2, "link building": 0.5}}.
+# A trailing * matches any word ending ("audit*" also finds "audits", "auditing");
+# spaces in a phrase match any run of whitespace. Matching ignores case.
+CAMPAIGN_TERMS: Dict[str, Dict[str, float]] = json.loads(
+    os.getenv("CAMPAIGN_TERMS", '{"default": {"audit*": 1}}')
+)
+DEFAULT_CAMPAIGN = os.getenv("DEFAULT_CAMPAIGN", "default")
+# A lead qualifies once its matched term weights add up to this
+QUALIFY_THRESHOLD = float(os.getenv("QUALIFY_THRESHOLD", "1"))
+
+
+class Qualification(BaseModel):
+    is_qualified: bool
+    score: float
+    matched_terms: Dict[str, int]  # term -> occurrences
+
+
+def _term_pattern(term: str) -> str:
+    prefix = term.endswith("*")
+    words = term.rstrip("*").strip().split()
+    pattern = r"\s+".join(re.escape(word) for word in words)
+    return rf"\b{pattern}\w*" if prefix else rf"\b{pattern}\b"
+
+
+@lru_cache(maxsize=64)
+def compile_terms(terms: Tuple[Tuple[str, float], ...]) -> Tuple["re.Pattern", Dict[str, Tuple[str, float]]]:
+    """
+    Builds one alternation with a named group per term, so a single scan of
+    the text scores every term. Longer terms go first so a phrase wins over
+    a word it starts with.
+    """
+    ordered = sorted(terms, key=lambda item: len(item[0]), reverse=True)
+    groups = {f"t{index}": (term, weight) for index, (term, weight) in enumerate(ordered)}
+    pattern = "|".join(f"(?P<{group}>{_term_pattern(term)})" for group, (term, _) in groups.items())
+    return re.compile(pattern or r"(?!)", re.IGNORECASE), groups
+
+
+def campaign_matcher(campaign: str = DEFAULT_CAMPAIGN):
+    """
+    The compiled matcher for a campaign's term set (compiled once, then cached),
+    falling back to the default campaign like lib/templates.py does.
+    """
+    terms = CAMPAIGN_TERMS.get(campaign)
+    if terms is None:
+        # The API rejects unknown campaigns, but a queued job can outlive a CAMPAIGN_TERMS change
+        print(f"Unknown campaign '{campaign}', scoring against '{DEFAULT_CAMPAIGN}'")
+        terms = CAMPAIGN_TERMS.get(DEFAULT_CAMPAIGN, {})
+    return compile_terms(tuple(sorted(terms.items())))
+
+
+def qualify(text: str, campaign: str = DEFAULT_CAMPAIGN, threshold: float = QUALIFY_THRESHOLD) -> Qualification:
+    """Scores the text against the campaign's terms; each distinct term counts its weight once."""
+    pattern, groups = campaign_matcher(campaign)
+    matched: Dict[str, int] = {}
+    for match in pattern.finditer(text):
+        term = groups[match.lastgroup][0]
+        matched[term] = matched.get(term, 0) + 1
+    score = sum(weight for term, weight in groups.values() if term in matched)
+    return Qualification(is_qualified=score >= threshold, score=round(score, 3), matched_terms=matched)
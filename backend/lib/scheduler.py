@@ -0,0 +1,138 @@
+import copy
+import json
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from pydantic import BaseModel
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- CONFIG ---
+# Defaults applied to every sender inbox. They are deliberately below what the mail provider
+# allows, a cold-outreach pace that keeps new inboxes out of spam folders; raise them to the
+# provider's limits for inboxes that can take it. Per-inbox overrides go in MAILBOX_LIMITS as JSON, e.g.
+# {"peter@pendoratech.com": {"hourly_cap": 6, "daily_cap": 40, "warmup_start": "2025-10-01"}}
+MAILBOX_HOURLY_CAP = int(os.getenv("MAILBOX_HOURLY_CAP", "12"))
+MAILBOX_DAILY_CAP = int(os.getenv("MAILBOX_DAILY_CAP", "100"))
+MAILBOX_WARMUP_INITIAL = int(os.getenv("MAILBOX_WARMUP_INITIAL", "10"))
+MAILBOX_WARMUP_STEP = int(os.getenv("MAILBOX_WARMUP_STEP", "5"))
+MAILBOX_LIMITS = json.loads(os.getenv("MAILBOX_LIMITS", "{}"))
+
+
+class MailboxLimits(BaseModel):
+    hourly_cap: int = MAILBOX_HOURLY_CAP
+    daily_cap: int = MAILBOX_DAILY_CAP
+    # While warming up the daily cap starts at warmup_initial and grows by warmup_step per day
+    warmup_start: Optional[date] = None
+    warmup_initial: int = MAILBOX_WARMUP_INITIAL
+    warmup_step: int = MAILBOX_WARMUP_STEP
+
+    def daily_cap_on(self, day: date) -> int:
+        if self.warmup_start is None:
+            return self.daily_cap
+        days_in = max((day - self.warmup_start).days, 0)
+        return min(self.daily_cap, self.warmup_initial + self.warmup_step * days_in)
+
+
+class TokenBucket:
+    """Continuous-refill bucket; `capacity` tokens per `period`, starting full."""
+
+    def __init__(self, capacity: int, period: timedelta, now: datetime):
+        self.capacity = capacity
+        self.refill_per_second = capacity / period.total_seconds()
+        self.tokens = float(capacity)
+        self.updated_at = now
+
+    def _refill(self, at: datetime):
+        if at <= self.updated_at:
+            return
+        elapsed = (at - self.updated_at).total_seconds()
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+        self.updated_at = at
+
+    def ready_at(self, at: datetime) -> datetime:
+        """Earliest time >= `at` when one token is available."""
+        at = max(at, self.updated_at)
+        self._refill(at)
+        if self.tokens >= 1:
+            return at
+        return at + timedelta(seconds=(1 - self.tokens) / self.refill_per_second)
+
+    def take(self, at: datetime):
+        self._refill(at)
+        self.tokens -= 1
+
+
+class MailboxSchedule:
+    def __init__(self, limits: MailboxLimits, now: datetime):
+        self.limits = limits
+        self.hourly = TokenBucket(limits.hourly_cap, timedelta(hours=1), now)
+        self.sent_per_day: Dict[date, int] = {}
+
+    def next_slot(self, not_before: datetime) -> datetime:
+        slot = self.hourly.ready_at(not_before)
+        # Roll over to the next UTC day until that day still has room under its (warm-up) cap
+        while self.sent_per_day.get(slot.date(), 0) >= self.limits.daily_cap_on(slot.date()):
+            next_day = datetime.combine(slot.date() + timedelta(days=1), time.min, tzinfo=timezone.utc)
+            slot = self.hourly.ready_at(next_day)
+        return slot
+
+    def book(self, slot: datetime):
+        self.hourly.take(slot)
+        self.sent_per_day[slot.date()] = self.sent_per_day.get(slot.date(), 0) + 1
+
+
+class SendScheduler:
+    """
+    Tracks hourly and daily send budgets per sender inbox and hands out the
+    earliest slot each inbox may send at without breaching its provider limits.
+    Budgets live in memory; cron.build_scheduler seeds them with what other
+    runs and workers have sent or claimed, so the caps hold across processes.
+    """
+
+    def __init__(self, now: Optional[datetime] = None):
+        self.now = now or datetime.now(timezone.utc)
+        self.mailboxes: Dict[str, MailboxSchedule] = {}
+
+    def limits_for(self, mailbox: str) -> MailboxLimits:
+        return MailboxLimits(**MAILBOX_LIMITS.get(mailbox, {}))
+
+    def _schedule(self, mailbox: str) -> MailboxSchedule:
+        schedule = self.mailboxes.get(mailbox)
+        if schedule is None:
+            schedule = MailboxSchedule(self.limits_for(mailbox), self.now)
+            self.mailboxes[mailbox] = schedule
+        return schedule
+
+    def record_sent(self, mailbox: str, sent_at: datetime):
+        """Count an already-sent email against the inbox budget (used to seed from history)."""
+        schedule = self._schedule(mailbox)
+        schedule.sent_per_day[sent_at.date()] = schedule.sent_per_day.get(sent_at.date(), 0) + 1
+        if self.now - sent_at < timedelta(hours=1):
+            schedule.hourly.tokens -= 1
+
+    def next_slot(self, mailbox: str, not_before: Optional[datetime] = None) -> datetime:
+        """The slot reserve() would book, without booking it."""
+        return self._schedule(mailbox).next_slot(not_before or datetime.now(timezone.utc))
+
+    def reserve(self, mailbox: str, not_before: Optional[datetime] = None) -> datetime:
+        """Book and return the earliest slot at or after `not_before` for `mailbox`."""
+        schedule = self._schedule(mailbox)
+        slot = schedule.next_slot(not_before or datetime.now(timezone.utc))
+        schedule.book(slot)
+        return slot
+
+    def plan(self, records: Iterable[dict]) -> List[Tuple[dict, datetime]]:
+        """
+        Project a send slot for every `scheduled-emails` row, in scheduled_time
+        order, without consuming this scheduler's budget.
+        """
+        projection = copy.deepcopy(self)
+        planned = []
+        for record in sorted(records, key=lambda r: (r.get("scheduled_time") or "", r.get("id") or 0)):
+            not_before = self.now
+            if record.get("scheduled_time"):
+                not_before = max(not_before, datetime.fromisoformat(record["scheduled_time"]))
+            planned.append((record, projection.reserve(record["mailbox"], not_before)))
+        return planned
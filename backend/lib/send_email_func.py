@@ -1,22 +1,21 @@
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import email.utils
-import os
 from dotenv import load_dotenv
 from email import charset
 import html2text
 from pydantic import BaseModel
 from typing import List
+from lib.smtp_pool import smtp_pool, SMTPDeliveryUnknown
+from lib.metrics import timed, SMTP_PHASE_SECONDS
+from lib.clients import get_settings
 
 charset.add_charset("utf-8", charset.QP, charset.QP, "utf-8")
 
 load_dotenv()
 
 # --- CONFIG ---
-SMTP_SERVER = "smtp.hostinger.com"
-SMTP_PORT = 587
-EMAIL_PASSWORD = os.getenv("SENDER_PASSWORD")
+# SMTP host/port and session limits live in lib/smtp_pool.py, the sender password in lib/clients.py
 SENDER_NAME = "Petrus Sheya"  # customize this
 
 class EmailRequest(BaseModel):
@@ -25,18 +24,8 @@ class EmailRequest(BaseModel):
     body_text: str
     sender_name: str = SENDER_NAME
 
-def convert_text_to_html(body_text: str) -> str:
-    """
-    Convert plain text body to HTML format by creating <p> tags for each line break.
-    """
-    # Split text by line breaks and filter out empty lines
-    lines = [line.strip() for line in body_text.split('\n') if line.strip()]
-    
-    # Convert each line to a paragraph
-    html_paragraphs = [f"<p>{line}</p>" for line in lines]
-    
-    # Create full HTML structure
-    html_body = f"""
+# Built once; only the paragraphs change between messages
+_HTML_SHELL = """
     <!DOCTYPE html>
     <html>
     <head>
@@ -44,35 +33,49 @@ def convert_text_to_html(body_text: str) -> str:
         <meta name="viewport" content="width=device-width, initial-scale=1.0">
         <title>Email</title>
         <style>
-            body {{
+            body {
                 font-family: Arial, sans-serif;
                 line-height: 1.6;
                 color: #333;
                 max-width: 600px;
                 margin: 0 auto;
                 padding: 20px;
-            }}
-            p {{
+            }
+            p {
                 margin-bottom: 16px;
-            }}
+            }
         </style>
     </head>
     <body>
-        {''.join(html_paragraphs)}
+        %PARAGRAPHS%
     </body>
     </html>
     """
-    
-    return html_body
+_HTML_HEAD, _HTML_TAIL = _HTML_SHELL.split("%PARAGRAPHS%")
 
-def send_email(to_address: str, subject: str, body_text: str, sender_name: str, email_inbox:str):
+def convert_text_to_html(body_text: str) -> str:
+    """
+    Convert plain text body to HTML format by creating <p> tags for each line break.
+    """
+    # Split text by line breaks and filter out empty lines
+    lines = [line.strip() for line in body_text.split('\n') if line.strip()]
+    return _HTML_HEAD + "".join([f"<p>{line}</p>" for line in lines]) + _HTML_TAIL
+
+def build_payload(to_address: str, subject: str, body_text: str, sender_name: str, email_inbox: str) -> bytes:
+    """
+    The serialized message, CRLF line endings and all, minus the per-send
+    headers (Date, Message-ID). It can be rendered ahead of time and stored;
+    finalize_payload adds those headers when the message is actually sent.
+    """
+    with timed(SMTP_PHASE_SECONDS, "smtp.render", phase="render"):
+        return _build_payload(to_address, subject, body_text, sender_name, email_inbox)
+
+def _build_payload(to_address: str, subject: str, body_text: str, sender_name: str, email_inbox: str) -> bytes:
     EMAIL_ADDRESS = email_inbox
     msg = MIMEMultipart("alternative")
     msg["From"] = f"{sender_name} <{EMAIL_ADDRESS}>"
     msg["To"] = to_address
     msg["Subject"] = subject
-    msg["Date"] = email.utils.formatdate(localtime=True)
-    msg["Message-ID"] = email.utils.make_msgid(domain=EMAIL_ADDRESS.split("@")[1])
     msg["Reply-To"] = EMAIL_ADDRESS
 
     # Convert plain text body to HTML format
@@ -87,19 +90,34 @@ def send_email(to_address: str, subject: str, body_text: str, sender_name: str,
     # Attach HTML version
     msg.attach(MIMEText(html_content, "html", "utf-8"))
 
+    return msg.as_bytes(policy=msg.policy.clone(linesep="\r\n"))
+
+def finalize_payload(payload: bytes, email_inbox: str) -> bytes:
+    """Prepends this send's Date and Message-ID; header order doesn't matter to SMTP."""
+    date = email.utils.formatdate(localtime=True)
+    message_id = email.utils.make_msgid(domain=email_inbox.split("@")[1])
+    return f"Date: {date}\r\nMessage-ID: {message_id}\r\n".encode("ascii") + payload
+
+def send_payload(to_address: str, email_inbox: str, payload: bytes):
+    """
+    Sends a payload from build_payload (fresh or pre-rendered) without re-encoding it.
+    Raises SMTPDeliveryUnknown when the connection failed after DATA: the message
+    may have gone out, so the caller must not send it again.
+    """
     print(f"[*] Preparing to send to {to_address} (Hostinger Webmail fingerprint)")
 
     try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            status_code, response = server.ehlo()
-            print(f"[*] EHLO: {status_code} {response.decode()}")
-            status_code, response = server.starttls()
-            print(f"[*] STARTTLS: {status_code} {response.decode()}")
-            status_code, response = server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            print(f"[*] LOGIN: {status_code} {response.decode()}")
-            server.sendmail(EMAIL_ADDRESS, [to_address], msg.as_string())
-            print(f"[+] Email sent to {to_address}")
-            return True, None
+        # Reuses an authenticated session for this inbox when one is available
+        smtp_pool.sendmail(email_inbox, get_settings().sender_password, [to_address], finalize_payload(payload, email_inbox))
+        print(f"[+] Email sent to {to_address}")
+        return True, None
+    except SMTPDeliveryUnknown as e:
+        print(f"[!] Delivery to {to_address} unknown: {e}")
+        raise
     except Exception as e:
         print(f"[!] Failed to send to {to_address}: {e}")
         return False, str(e)
+
+def send_email(to_address: str, subject: str, body_text: str, sender_name: str, email_inbox:str):
+    payload = build_payload(to_address, subject, body_text, sender_name, email_inbox)
+    return send_payload(to_address, email_inbox, payload)
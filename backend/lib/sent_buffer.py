@@ -0,0 +1,193 @@
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import IO, List, Optional
+from supabase import Client
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # Windows: journals then aren't locked, so run a single sending process there
+    fcntl = None
+
+load_dotenv()
+
+# --- CONFIG ---
+SENT_BUFFER_FLUSH_EVERY = int(os.getenv("SENT_BUFFER_FLUSH_EVERY", "20"))
+SENT_BUFFER_FLUSH_SECONDS = float(os.getenv("SENT_BUFFER_FLUSH_SECONDS", "30"))
+# Each process journals to its own file in here, locked for as long as the process runs
+SENT_JOURNAL_DIR = os.getenv(
+    "SENT_JOURNAL_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sent-journal"),
+)
+
+
+def _lock_journal(journal: IO) -> bool:
+    """Takes the journal's exclusive lock without waiting; False while another process holds it."""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(journal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+def sent_row(record: dict, sent_at: Optional[datetime] = None) -> dict:
+    """Maps a `scheduled-emails` row to its `sent-emails` row, sent at `sent_at` (default now)."""
+    return {
+        # Unique in sent-emails (sql/sent_emails_scheduled_id.sql), so recording twice is a no-op
+        "scheduled_id": record.get("id"),
+        "name": record.get("sender_name"),
+        "email": record.get("recipient"),
+        # When it actually went out, which is what cron.build_scheduler counts against the caps;
+        # a caught-up row can go out long after its scheduled_time
+        "sent_at": (sent_at or datetime.now(timezone.utc)).isoformat(),
+        "body_text": record.get("body_text"),
+        "mailbox": record.get("mailbox"),
+    }
+
+
+class SentBuffer:
+    """
+    Write-behind buffer for sent emails. Every send is appended to a local
+    journal first, then rows are moved from `scheduled-emails` to `sent-emails`
+    in bulk every `flush_every` records or `flush_seconds` seconds. Whatever is
+    left in a journal after a crash is replayed by `replay()` on the next run.
+
+    The journal belongs to this process and stays locked while it runs, so the
+    API and `python -m lib.cron` never truncate or replay each other's entries.
+    """
+
+    def __init__(
+        self,
+        supabase: Client,
+        flush_every: int = SENT_BUFFER_FLUSH_EVERY,
+        flush_seconds: float = SENT_BUFFER_FLUSH_SECONDS,
+        journal_dir: str = SENT_JOURNAL_DIR,
+    ):
+        self.supabase = supabase
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self.journal_dir = journal_dir
+        os.makedirs(journal_dir, exist_ok=True)
+        # The pid says whose it is; the suffix keeps a reused pid off a dead process's journal
+        self.journal_path = os.path.join(journal_dir, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl")
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        _lock_journal(self._journal)
+        self._pending: List[dict] = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, record: dict):
+        entry = {"id": record.get("id"), "row": sent_row(record)}
+        with self._lock:
+            self._journal.write(json.dumps(entry) + "\n")
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._pending.append(entry)
+            if self._due():
+                self._flush_locked()
+
+    def pending_ids(self) -> set:
+        with self._lock:
+            return {entry["id"] for entry in self._pending}
+
+    def pending_rows(self) -> List[dict]:
+        """`sent-emails` rows sent but not recorded yet, for counting against the inbox caps."""
+        with self._lock:
+            return [entry["row"] for entry in self._pending]
+
+    def _due(self) -> bool:
+        return bool(self._pending) and (
+            len(self._pending) >= self.flush_every
+            or time.monotonic() - self._last_flush >= self.flush_seconds
+        )
+
+    def flush_if_due(self):
+        with self._lock:
+            if self._due():
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        ids = [entry["id"] for entry in self._pending]
+        try:
+            # Delete first: if we die before the insert, the journal still holds
+            # the rows, and the email can never be picked up and sent twice
+            self.supabase.table("scheduled-emails").delete().in_("id", ids).execute()
+            # An upsert, so retrying after an insert that failed ambiguously records nothing twice
+            self.supabase.table("sent-emails").upsert(
+                [entry["row"] for entry in self._pending], on_conflict="scheduled_id", ignore_duplicates=True
+            ).execute()
+        except Exception as e:
+            # Keep the entries (and the journal) for the next flush
+            print(f"❌ Failed to record {len(ids)} sent email(s), will retry: {e}")
+            return
+        print(f"🗂️ Recorded {len(ids)} sent email(s)")
+        self._pending.clear()
+        self._last_flush = time.monotonic()
+        # Everything in the journal is now persisted remotely
+        self._journal.truncate(0)
+
+    def _adopt(self, path: str) -> Optional[IO]:
+        """Another journal, locked, if the process that wrote it is gone and it still exists."""
+        try:
+            journal = open(path, encoding="utf-8")
+        except FileNotFoundError:
+            return None
+        try:
+            # Still on the same file after locking: not one another replay has just recorded and deleted
+            if _lock_journal(journal) and os.fstat(journal.fileno()).st_ino == os.stat(path).st_ino:
+                return journal
+        except FileNotFoundError:
+            pass
+        journal.close()
+        return None
+
+    def replay(self):
+        """
+        Re-queues and flushes entries that exited processes journaled but never
+        recorded. Journals still locked by a running process are left alone.
+        """
+        with self._lock:
+            known = {entry["id"] for entry in self._pending}
+            replayed = 0
+            for path in sorted(glob.glob(os.path.join(self.journal_dir, "*.jsonl"))):
+                if path == self.journal_path:
+                    continue
+                journal = self._adopt(path)
+                if journal is None:
+                    continue
+                with journal:
+                    for line in journal:
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            # A torn final line from a crash mid-write
+                            continue
+                        if entry["id"] not in known:
+                            self._journal.write(json.dumps(entry) + "\n")
+                            self._pending.append(entry)
+                            known.add(entry["id"])
+                            replayed += 1
+                    # Only dropped once its entries are safe in our journal, and while still locked
+                    self._journal.flush()
+                    os.fsync(self._journal.fileno())
+                    if fcntl is not None:
+                        os.remove(path)
+                if fcntl is None:
+                    # Windows can't remove a file that is still open
+                    os.remove(path)
+            if replayed:
+                print(f"🔁 Replaying {replayed} journaled sent email(s)")
+            self._flush_locked()
@@ -0,0 +1,247 @@
+import re
+import smtplib
+import threading
+import time
+import os
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+from lib.metrics import timed, SMTP_PHASE_SECONDS
+
+load_dotenv()
+
+# --- CONFIG ---
+SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.hostinger.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+# Only for local sinks such as bench/smtp_sink.py; Hostinger requires STARTTLS before AUTH
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+# How many authenticated sessions one mailbox may hold open at once
+SMTP_POOL_MAX_SESSIONS = int(os.getenv("SMTP_POOL_MAX_SESSIONS", "2"))
+# Recycle a session after this many messages so the server never sees a marathon connection
+SMTP_POOL_MAX_MESSAGES = int(os.getenv("SMTP_POOL_MAX_MESSAGES", "50"))
+# Idle sessions older than this are dropped instead of NOOP-checked
+SMTP_POOL_MAX_IDLE = float(os.getenv("SMTP_POOL_MAX_IDLE", "240"))
+
+
+class SMTPDeliveryUnknown(smtplib.SMTPException):
+    """
+    The connection failed after the message data was sent, so the server may have
+    accepted it. Sending it again could deliver it twice, so it is never retried.
+    """
+
+
+class SMTPSession:
+    """One authenticated SMTP connection plus the bookkeeping the pool needs."""
+
+    def __init__(self, email_inbox: str, password: str):
+        self.email_inbox = email_inbox
+        with timed(SMTP_PHASE_SECONDS, "smtp.connect", phase="connect"):
+            self.server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        try:
+            with timed(SMTP_PHASE_SECONDS, "smtp.ehlo", phase="ehlo"):
+                status_code, response = self.server.ehlo()
+            print(f"[*] EHLO: {status_code} {response.decode()}")
+            if SMTP_STARTTLS:
+                with timed(SMTP_PHASE_SECONDS, "smtp.starttls", phase="starttls"):
+                    status_code, response = self.server.starttls()
+                print(f"[*] STARTTLS: {status_code} {response.decode()}")
+                # The server forgets the pre-TLS EHLO, so greet again before auth
+                with timed(SMTP_PHASE_SECONDS, "smtp.ehlo", phase="ehlo"):
+                    self.server.ehlo()
+            with timed(SMTP_PHASE_SECONDS, "smtp.login", phase="login"):
+                status_code, response = self.server.login(email_inbox, password)
+            print(f"[*] LOGIN: {status_code} {response.decode()}")
+        except BaseException:
+            # A session that never got through login would otherwise leak its socket
+            self.server.close()
+            raise
+        self.messages_sent = 0
+        self.last_used = time.monotonic()
+
+    def is_alive(self) -> bool:
+        if time.monotonic() - self.last_used > SMTP_POOL_MAX_IDLE:
+            return False
+        try:
+            with timed(SMTP_PHASE_SECONDS, "smtp.noop", phase="noop"):
+                status_code, _ = self.server.noop()
+            return status_code == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def sendmail(self, from_address: str, to_addresses: List[str], message):
+        """smtplib's sendmail, split at DATA so a failure says whether the message could have gone out."""
+        server = self.server
+        server.ehlo_or_helo_if_needed()
+        options = [f"size={len(message)}"] if server.does_esmtp and server.has_extn("size") else []
+        status_code, response = server.mail(from_address, options)
+        if status_code != 250:
+            self._abort(status_code)
+            raise smtplib.SMTPSenderRefused(status_code, response, from_address)
+        refused = {}
+        for address in to_addresses:
+            status_code, response = server.rcpt(address)
+            if status_code not in (250, 251):
+                refused[address] = (status_code, response)
+            if status_code == 421:
+                server.close()
+                raise smtplib.SMTPResponseException(status_code, response)
+        if len(refused) == len(to_addresses):
+            self._abort(status_code)
+            raise smtplib.SMTPRecipientsRefused(refused)
+        # Nothing of the message goes out before the 354, so failing up to here is still safe to retry
+        status_code, response = server.docmd("data")
+        if status_code != 354:
+            self._abort(status_code)
+            raise smtplib.SMTPDataError(status_code, response)
+        # Dot-stuffed and terminated as smtplib's data() does
+        body = re.sub(rb"(?m)^\.", b"..", message)
+        if not body.endswith(b"\r\n"):
+            body += b"\r\n"
+        try:
+            server.send(body + b".\r\n")
+            status_code, response = server.getreply()
+        except OSError as e:
+            raise SMTPDeliveryUnknown(f"Connection lost after DATA: {e}") from e
+        if status_code == 421:
+            server.close()
+            raise SMTPDeliveryUnknown(f"421 after DATA: {response.decode(errors='replace')}")
+        if status_code != 250:
+            # Refused outright, so nothing was delivered
+            self._abort(status_code)
+            raise smtplib.SMTPDataError(status_code, response)
+        return refused
+
+    def _abort(self, status_code: int):
+        """Ends a refused transaction like smtplib does: RSET, or drop the connection on a 421."""
+        if status_code == 421:
+            self.server.close()
+            return
+        try:
+            self.server.rset()
+        except smtplib.SMTPServerDisconnected:
+            pass
+
+    def close(self):
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            try:
+                self.server.close()
+            except OSError:
+                pass
+
+
+class _MailboxPool:
+    def __init__(self, max_sessions: int):
+        self.idle: List[SMTPSession] = []
+        self.slots = threading.BoundedSemaphore(max_sessions)
+
+
+class SMTPPool:
+    """
+    Keeps authenticated SMTP sessions alive per sender inbox so a batch pays
+    for EHLO/STARTTLS/LOGIN once per session instead of once per message.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = SMTP_POOL_MAX_SESSIONS,
+        max_messages: int = SMTP_POOL_MAX_MESSAGES,
+    ):
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self._pools: Dict[str, _MailboxPool] = {}
+        self._lock = threading.Lock()
+
+    def _pool_for(self, email_inbox: str) -> _MailboxPool:
+        with self._lock:
+            pool = self._pools.get(email_inbox)
+            if pool is None:
+                pool = _MailboxPool(self.max_sessions)
+                self._pools[email_inbox] = pool
+            return pool
+
+    def _checkout(self, pool: _MailboxPool, email_inbox: str, password: str) -> SMTPSession:
+        while True:
+            with self._lock:
+                session = pool.idle.pop() if pool.idle else None
+            if session is None:
+                return SMTPSession(email_inbox, password)
+            if session.is_alive():
+                return session
+            print(f"[*] Dropping stale SMTP session for {email_inbox}")
+            session.close()
+
+    def _checkin(self, pool: _MailboxPool, session: SMTPSession):
+        if session.messages_sent >= self.max_messages:
+            session.close()
+            return
+        session.last_used = time.monotonic()
+        with self._lock:
+            pool.idle.append(session)
+
+    @contextmanager
+    def session(self, email_inbox: str, password: str):
+        """
+        Borrow an authenticated session for `email_inbox`. Blocks while the
+        mailbox already has `max_sessions` sessions checked out.
+        """
+        pool = self._pool_for(email_inbox)
+        with pool.slots:
+            session = self._checkout(pool, email_inbox, password)
+            try:
+                yield session
+            except smtplib.SMTPResponseException as e:
+                # smtplib already RSETs after a refused recipient, so the session
+                # survives per-message rejections but not a 421 shutdown
+                if e.smtp_code == 421:
+                    session.close()
+                else:
+                    self._checkin(pool, session)
+                raise
+            except BaseException:
+                # Never hand a session in an unknown state back to the pool
+                session.close()
+                raise
+            else:
+                self._checkin(pool, session)
+
+    def sendmail(self, email_inbox: str, password: str, to_addresses: List[str], message):
+        """
+        Send a serialized message through a pooled session. A dropped connection
+        or a 421 (service closing) before DATA, whether while checking out the
+        session or during MAIL/RCPT, is retried once on a fresh session. From DATA
+        on the message may already be delivered, so that raises SMTPDeliveryUnknown.
+        """
+        for attempt in range(2):
+            try:
+                with self.session(email_inbox, password) as session:
+                    with timed(SMTP_PHASE_SECONDS, "smtp.sendmail", phase="sendmail"):
+                        session.sendmail(email_inbox, to_addresses, message)
+                    session.messages_sent += 1
+                    return
+            except smtplib.SMTPServerDisconnected:
+                if attempt:
+                    raise
+                print(f"[*] SMTP session for {email_inbox} disconnected, reconnecting")
+            except smtplib.SMTPResponseException as e:
+                if e.smtp_code != 421 or attempt:
+                    raise
+                print(f"[*] SMTP 421 for {email_inbox}, reconnecting")
+
+    def close(self, email_inbox: Optional[str] = None):
+        """Close idle sessions for one mailbox, or for all of them."""
+        with self._lock:
+            if email_inbox is None:
+                pools = list(self._pools.values())
+            else:
+                pools = [self._pools[email_inbox]] if email_inbox in self._pools else []
+            sessions = [session for pool in pools for session in pool.idle]
+            for pool in pools:
+                pool.idle.clear()
+        for session in sessions:
+            session.close()
+
+
+smtp_pool = SMTPPool()
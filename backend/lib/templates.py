@@ -0,0 +1,123 @@
+import json
+import os
+import re
+import string
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- CONFIG ---
+# One <campaign>.json per campaign: "subject" and "body" templates with {field} placeholders,
+# "variants" ("qualified"/"unqualified") holding snippets or subject/body overrides, and "constants"
+TEMPLATES_DIR = os.getenv(
+    "TEMPLATES_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates"),
+)
+DEFAULT_TEMPLATE = "default"
+
+_formatter = string.Formatter()
+
+
+class TemplateError(ValueError):
+    pass
+
+
+def _segments(text: str, statics: Dict[str, str], depth: int = 0) -> List[Tuple[str, bool]]:
+    """(text, is_field) pieces, with variant snippets and constants inlined."""
+    if depth > 5:
+        raise TemplateError("Template snippets nest too deeply (or refer to themselves)")
+    pieces: List[Tuple[str, bool]] = []
+    for literal, field, format_spec, conversion in _formatter.parse(text):
+        if literal:
+            pieces.append((literal, False))
+        if field is None:
+            continue
+        if not field.isidentifier() or format_spec or conversion:
+            raise TemplateError(f"Unsupported placeholder {{{field}}}, use plain {{field_name}}")
+        if field in statics:
+            pieces.extend(_segments(statics[field], statics, depth + 1))
+        else:
+            pieces.append((field, True))
+    return pieces
+
+
+def compile_text(text: str, statics: Optional[Dict[str, str]] = None) -> Callable[[dict], str]:
+    """
+    Compiles a template to a function of the lead fields. The literal parts are
+    parsed and merged once, so rendering is a single join with no formatting.
+    """
+    merged: List[Tuple[str, bool]] = []
+    for piece, is_field in _segments(text, statics or {}):
+        if merged and not is_field and not merged[-1][1]:
+            merged[-1] = (merged[-1][0] + piece, False)
+        else:
+            merged.append((piece, is_field))
+    segments = tuple(merged)
+    return lambda values: "".join([values[piece] if is_field else piece for piece, is_field in segments])
+
+
+class CompiledTemplate:
+    """Subject and body render functions for each variant of one campaign template."""
+
+    def __init__(self, name: str, source: dict):
+        self.name = name
+        self.constants: Dict[str, str] = source.get("constants", {})
+        self.variants: Dict[str, Tuple[Callable, Callable]] = {}
+        for variant, overrides in (source.get("variants") or {"default": {}}).items():
+            statics = {**self.constants, **overrides}
+            subject = statics.pop("subject", source["subject"])
+            body = statics.pop("body", source["body"])
+            self.variants[variant] = (compile_text(subject, statics), compile_text(body, statics))
+
+    def variant_for(self, lead: dict) -> str:
+        if len(self.variants) == 1:
+            return next(iter(self.variants))
+        return "qualified" if lead.get("is_qualified") else "unqualified"
+
+    def render(self, lead: dict, variant: Optional[str] = None) -> Tuple[str, str]:
+        """(subject, body) for one lead; raises KeyError for a placeholder the lead doesn't fill."""
+        subject, body = self.variants[variant or self.variant_for(lead)]
+        return subject(lead), body(lead)
+
+    def render_batch(self, leads: Iterable[dict]) -> List[Tuple[str, str]]:
+        rendered = []
+        for lead in leads:
+            subject, body = self.variants[self.variant_for(lead)]
+            rendered.append((subject(lead), body(lead)))
+        return rendered
+
+
+_compiled: Dict[str, Tuple[float, CompiledTemplate]] = {}
+_lock = threading.Lock()
+
+
+def get_template(campaign: str = DEFAULT_TEMPLATE) -> CompiledTemplate:
+    """
+    The compiled template for a campaign, falling back to the default one.
+    Recompiled only when its file changes, so templates can be edited live.
+    """
+    path = os.path.join(TEMPLATES_DIR, f"{campaign}.json")
+    # Campaign names come from requests, so they never get to pick an arbitrary path
+    if campaign != DEFAULT_TEMPLATE and (not re.fullmatch(r"[\w-]+", campaign) or not os.path.exists(path)):
+        return get_template(DEFAULT_TEMPLATE)
+    mtime = os.path.getmtime(path)
+    with _lock:
+        cached = _compiled.get(campaign)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path, encoding="utf-8") as f:
+            template = CompiledTemplate(campaign, json.load(f))
+        _compiled[campaign] = (mtime, template)
+        print(f"[*] Compiled email template '{campaign}' ({', '.join(template.variants)})")
+        return template
+
+
+def render_email(lead: dict, campaign: str = DEFAULT_TEMPLATE) -> Tuple[str, str]:
+    return get_template(campaign).render(lead)
+
+
+def render_batch(leads: Iterable[dict], campaign: str = DEFAULT_TEMPLATE) -> List[Tuple[str, str]]:
+    """(subject, body) for many leads with a single template lookup."""
+    return get_template(campaign).render_batch(leads)
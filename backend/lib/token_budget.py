@@ -0,0 +1,120 @@
+import math
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import List
+from pydantic import BaseModel
+from dotenv import load_dotenv
+from lib.metrics import DOSSIER_COMPRESSIONS, DOSSIER_TOKENS
+
+try:
+    import tiktoken
+except ImportError:  # Token counts then fall back to the 4-characters-per-token estimate
+    tiktoken = None
+
+load_dotenv()
+
+# --- CONFIG ---
+# Most tokens of website content that go into the generation prompt
+PROMPT_DOSSIER_TOKENS = int(os.getenv("PROMPT_DOSSIER_TOKENS", "2000"))
+# o200k_base is the encoding of the gpt-4o / gpt-5 model families
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")
+# Sentences with fewer words than this are menu items, buttons and labels
+MIN_SENTENCE_WORDS = int(os.getenv("MIN_SENTENCE_WORDS", "4"))
+
+BOILERPLATE_PATTERNS = re.compile(
+    r"cookie|privacy policy|terms (of|and) (use|service|conditions)|all rights reserved|©|copyright"
+    r"|subscribe to our newsletter|sign up for our newsletter|skip to (main )?content|javascript",
+    re.IGNORECASE,
+)
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'])|\n+")
+WORD = re.compile(r"[a-z0-9][a-z0-9'\-]*")
+
+
+class Compression(BaseModel):
+    text: str
+    tokens_before: int
+    tokens_after: int
+    sentences_dropped: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception as e:
+        # The encoding file is downloaded on first use and may not be reachable
+        print(f"Could not load the {TOKENIZER_ENCODING} tokenizer, estimating tokens instead: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return math.ceil(len(text) / 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in SENTENCE_SPLIT.split(text) if sentence and sentence.strip()]
+
+
+def compress_dossier(text: str, max_tokens: int = PROMPT_DOSSIER_TOKENS) -> Compression:
+    """
+    Fits website text into `max_tokens`. Boilerplate, fragments and repeated
+    sentences are dropped; if it is still too long, the most distinctive
+    sentences (rare words within this site, with a bonus for appearing early)
+    are kept, in their original order.
+    """
+    tokens_before = count_tokens(text)
+    DOSSIER_COMPRESSIONS.inc()
+    DOSSIER_TOKENS.labels(stage="before").inc(tokens_before)
+    if tokens_before <= max_tokens:
+        DOSSIER_TOKENS.labels(stage="after").inc(tokens_before)
+        return Compression(text=text, tokens_before=tokens_before, tokens_after=tokens_before, sentences_dropped=0)
+
+    sentences = split_sentences(text)
+    seen = set()
+    candidates = []  # (position, sentence, words)
+    for position, sentence in enumerate(sentences):
+        words = WORD.findall(sentence.lower())
+        key = " ".join(words)
+        if len(words) < MIN_SENTENCE_WORDS or key in seen or BOILERPLATE_PATTERNS.search(sentence):
+            continue
+        seen.add(key)
+        candidates.append((position, sentence, words))
+
+    # Sentences are the documents: a word found in few of them says more about this business
+    document_frequency = Counter(word for _, _, words in candidates for word in set(words))
+    total = len(candidates) or 1
+
+    def score(candidate) -> float:
+        position, _, words = candidate
+        unique = set(words)
+        rarity = sum(math.log(total / document_frequency[word]) for word in unique) / math.sqrt(len(words))
+        return rarity * (1 + 1 / (1 + position / 20))
+
+    kept, used = [], 0
+    for candidate in sorted(candidates, key=score, reverse=True):
+        cost = count_tokens(candidate[1]) + 1
+        if used + cost > max_tokens:
+            continue
+        kept.append(candidate)
+        used += cost
+
+    compressed = "\n".join(sentence for _, sentence, _ in sorted(kept))
+    tokens_after = count_tokens(compressed)
+    DOSSIER_TOKENS.labels(stage="after").inc(tokens_after)
+    return Compression(
+        text=compressed,
+        tokens_before=tokens_before,
+        tokens_after=tokens_after,
+        sentences_dropped=len(sentences) - len(kept),
+    )
@@ -1,38 +1,36 @@
 from lib import send_email_func
 from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi.responses import Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 import os
 from dotenv import load_dotenv
-from typing import List, Optional
-from openai import OpenAI
-from playwright.async_api import async_playwright, Browser, Playwright
-from apify_client import ApifyClient
+from typing import Dict, List, Optional
 from datetime import datetime
 import asyncio
 import sys
-from lib import dossier,cron
+from lib import dossier,cron,prerender
+from lib.smtp_pool import smtp_pool, SMTPDeliveryUnknown
+from lib.browser_pool import BrowserPoolSaturated
+from lib.dossier_cache import normalize_url
+from lib.jobs import Job, get_job_queue, FINISHED_STATUSES
+from lib.qualify import CAMPAIGN_TERMS, DEFAULT_CAMPAIGN
+from lib.llm import llm
+from lib.linkedin import linkedin
+from lib.metrics import register_browser_pool
+from lib.clients import BANNER, BROWSER_PRELAUNCH, get_settings, get_browser_pool, browser_pool_stats, close_browser_pool
 
 if sys.platform.startswith("win"):
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-print("\033[1;32;40mA PENDORIAN PRODUCTION\033[0m")
-print("\033[1;32;40mA PENDORIAN PRODUCTION\033[0m")
 
 # Load environment variables
 load_dotenv()
 # --- EMAIL CONFIG ---
-SMTP_SERVER = "smtp.hostinger.com"
-SMTP_PORT = 587
-EMAIL_ADDRESS = os.getenv("SENDER_EMAIL")
-EMAIL_PASSWORD = os.getenv("SENDER_PASSWORD")
+# SMTP host/port live in lib/smtp_pool.py, the sender credentials in lib/clients.py
 SENDER_NAME = os.getenv("SENDER_NAME")
-
-# Initialize API clients from environment variables
-
-openai_api_key = os.getenv("OPEN_AI_API_KEY")
-apify_token = os.getenv("APIFY_TOKEN")
-client = OpenAI(api_key=openai_api_key)
-apify_client = ApifyClient(apify_token)
+# How many leads of one /generate-emails/batch call are scraped at the same time
+GENERATE_BATCH_CONCURRENCY = int(os.getenv("GENERATE_BATCH_CONCURRENCY", "4"))
 
 # --- FastAPI Setup ---
 app = FastAPI(
@@ -40,30 +38,26 @@ app = FastAPI(
     description="An API to generate personalized cold emails by scraping websites and LinkedIn.",
     version="1.0.0"
 )
-playwright_instance: Optional[Playwright] = None
-browser_instance: Optional[Browser] = None
 @app.on_event("startup")
 async def startup_event():
     """
-    Initializes the Playwright browser instance when the FastAPI app starts.
+    Clients are created on first use (see lib/clients.py); the browsers only
+    launch here with BROWSER_PRELAUNCH, otherwise on the first scrape that needs one.
     """
-    print("Starting up Playwright browser...")
-    global playwright_instance, browser_instance
-    playwright_instance = await async_playwright().start()
-    browser_instance = await playwright_instance.chromium.launch(headless=True, timeout=60000)
-    print("Playwright browser started.")
+    print(BANNER)
+    register_browser_pool(browser_pool_stats)
+    if BROWSER_PRELAUNCH:
+        await get_browser_pool()
 @app.on_event("shutdown")
 async def shutdown_event():
     """
-    Closes the Playwright browser instance when the FastAPI app shuts down.
+    Closes the Playwright browsers (if they were launched) and the shared clients.
     """
-    print("Shutting down Playwright browser...")
-    global browser_instance, playwright_instance
-    if browser_instance:
-        await browser_instance.close()
-    if playwright_instance:
-        await playwright_instance.stop()
-    print("Playwright browser shut down.")
+    await close_browser_pool()
+    await dossier.close_http_client()
+    await llm.close()
+    await linkedin.close()
+    smtp_pool.close()
 
 origins = [
     "https://edinburgh-nine.vercel.app",
@@ -89,6 +83,15 @@ class Email_Request(BaseModel):
     decision_maker_title: str
     linkedin_url: str
     website_url: str
+    campaign: str = DEFAULT_CAMPAIGN
+
+    @field_validator("campaign")
+    @classmethod
+    def known_campaign(cls, campaign: str) -> str:
+        # Rejected up front (422) instead of failing the request after the scrape
+        if campaign not in CAMPAIGN_TERMS:
+            raise ValueError(f"Unknown campaign '{campaign}', expected one of: {', '.join(CAMPAIGN_TERMS)}")
+        return campaign
 class Email_Sending_Request(BaseModel):
     recipient: str
     subject: str
@@ -99,6 +102,14 @@ class Email_Sending_Response(BaseModel):
     successful_recipients:list
 class SuccessMessage(BaseModel):
     message: str
+class Job_Submitted(BaseModel):
+    job_id: str
+    status: str
+class Batch_Email_Result(BaseModel):
+    index: int
+    website_url: str
+    email: Optional[Custom_Email] = None
+    error: Optional[str] = None
 # --- API Endpoints ---
 
 @app.post("/generate-email", response_model=Custom_Email)
@@ -108,54 +119,162 @@ async def generate_personalized_email(request_data: Email_Request):
     """
     try:
         print("Received Generate Email Request: ",datetime.now())
-        # 1. Scrape Website
-        website_content = await dossier.extract_info_from_website(request_data.website_url, browser_instance)
-        if not website_content["dossier"]:
+        # 1. Ask for the LinkedIn posts first, so the actor run overlaps with the website scrape
+        linkedin_request = await linkedin.request(request_data.linkedin_url)
+        # 2. Scrape Website
+        website_content = await dossier.extract_info_from_website(
+            request_data.website_url, campaign=request_data.campaign
+        )
+        if not website_content or not website_content["dossier"]:
             raise HTTPException(status_code=500, detail="Could not scrape or summarize website content.")
 
-        # 2. Scrape LinkedIn
-        # linkedin_posts = dossier.extract_linkedin_posts(request_data.linkedin_url)
-        # Note: LinkedIn scraping can sometimes fail, so we'll pass an empty list if there's no data.
-
-        # 3. Create Dossier
-        lead_dossier = {
-            "company_name": request_data.company_name,
-            "decision_maker_name": request_data.decision_maker_name,
-            "decision_maker_title": request_data.decision_maker_title,
-            "website_content": website_content["dossier"],
-            "is_qualified":website_content["is_qualified"]
-        }
-        # 4. Generate Email
-        final_email = dossier.generateCustomEmail(lead_dossier)
+        # 3. Use the posts if they are cached or already in; a run still going fills the cache for next time
+        linkedin_posts = await linkedin.posts(linkedin_request)
+
+        # 4. Create Dossier
+        lead_dossier = dossier.build_lead_dossier(request_data.model_dump(), website_content, linkedin_posts)
+        # 5. Generate Email
+        final_email = await dossier.generateCustomEmail(lead_dossier)
         return final_email
 
     except HTTPException as e:
         # Re-raise explicit HTTP exceptions
         raise e
+    except BrowserPoolSaturated as e:
+        # Every browser context is busy and the queue is full, ask the client to back off
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
     except Exception as e:
         # Catch any other unexpected errors
         print(f"An unexpected error occurred: {e}")
         raise HTTPException(status_code=500, detail="An unexpected error occurred during email generation.")
+@app.post("/generate-emails/batch")
+async def generate_personalized_emails_batch(requests: List[Email_Request]):
+    """
+    Generates emails for many leads in one call. Results are streamed back as NDJSON
+    (one Batch_Email_Result per line) in completion order; a failed lead only
+    produces an error line.
+    """
+    print(f"Received Batch Generate Email Request ({len(requests)} leads): ",datetime.now())
+    semaphore = asyncio.Semaphore(GENERATE_BATCH_CONCURRENCY)
+    # Leads sharing a website (and campaign) share one scrape
+    scrapes: Dict[tuple, asyncio.Task] = {}
+
+    async def scrape(url: str, campaign: str):
+        async with semaphore:
+            return await dossier.extract_info_from_website(url, campaign=campaign)
+
+    async def process(index: int, request_data: Email_Request) -> Batch_Email_Result:
+        result = Batch_Email_Result(index=index, website_url=request_data.website_url)
+        try:
+            # Already queued by the prefetch below, this just picks up the shared run
+            linkedin_request = await linkedin.request(request_data.linkedin_url)
+            key = (normalize_url(request_data.website_url), request_data.campaign)
+            if key not in scrapes:
+                scrapes[key] = asyncio.create_task(scrape(request_data.website_url, request_data.campaign))
+            website_content = await scrapes[key]
+            if not website_content or not website_content["dossier"]:
+                result.error = "Could not scrape or summarize website content."
+                return result
+            linkedin_posts = await linkedin.posts(linkedin_request)
+            lead_dossier = dossier.build_lead_dossier(request_data.model_dump(), website_content, linkedin_posts)
+            result.email = await dossier.generateCustomEmail(lead_dossier)
+        except Exception as e:
+            print(f"Batch item {index} failed: {e}")
+            result.error = str(e) or e.__class__.__name__
+        return result
+
+    async def stream():
+        # Every profile of the batch goes out at once, LINKEDIN_BATCH_SIZE per actor run
+        await linkedin.prefetch(item.linkedin_url for item in requests)
+        tasks = [asyncio.create_task(process(index, item)) for index, item in enumerate(requests)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                result = await finished
+                yield result.model_dump_json(exclude_none=True) + "\n"
+        finally:
+            # The client went away mid-stream, stop scraping for it
+            for task in [*tasks, *scrapes.values()]:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+@app.post("/jobs/generate-email", response_model=Job_Submitted)
+async def submit_generate_email_job(request_data: Email_Request):
+    """
+    Queues an email generation for the scraper workers (worker.py) and returns right away.
+    """
+    job = await asyncio.to_thread(get_job_queue().submit, "generate-email", request_data.model_dump())
+    return {"job_id": job.id, "status": job.status}
+@app.get("/jobs/{job_id}", response_model=Job)
+async def get_job(job_id: str):
+    """
+    Current status of a queued job; `result` holds the Custom_Email once it is done.
+    """
+    job = await asyncio.to_thread(get_job_queue().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+@app.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str):
+    """
+    Server-sent events with the job on every status change, until it is done or failed.
+    """
+    queue = get_job_queue()
+    if await asyncio.to_thread(queue.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+
+    async def events():
+        last_status = None
+        while True:
+            job = await asyncio.to_thread(queue.get, job_id)
+            if job.status != last_status:
+                last_status = job.status
+                yield f"event: status\ndata: {job.model_dump_json()}\n\n"
+            if job.status in FINISHED_STATUSES:
+                return
+            await asyncio.sleep(1)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+@app.get("/scrape-stats")
+async def scrape_stats():
+    """
+    How many scrapes each tier (plain HTTP vs. headless browser) has served, plus browser pool usage.
+    """
+    return {
+        "tiers": dict(dossier.fetch_tier_stats),
+        "browser_pool": browser_pool_stats(),
+    }
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus metrics: scrape, generation, SMTP and Supabase latencies, per-mailbox send counts and browser pool gauges.
+    """
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 @app.post("/send-email", response_model=Email_Sending_Response)
 def send_emails_endpoint(request: Email_Sending_Request):
     print("Received Send Email Request: ",datetime.now())
 
-    if not EMAIL_ADDRESS or not EMAIL_PASSWORD:
+    settings = get_settings()
+    if not settings.sender_email or not settings.sender_password:
         raise HTTPException(status_code=500, detail="Email address or password environment variables not set.")
 
     successful_sends = []
     failed_sends = {}
     
-    success, error_message = send_email_func.send_email(
-        to_address=request["recipient"],
-        subject=request.subject,
-        body_text=request.body_text,
-        sender_name=request.sender_name
-    )
+    try:
+        success, error_message = send_email_func.send_email(
+            to_address=request.recipient,
+            subject=request.subject,
+            body_text=request.body_text,
+            sender_name=request.sender_name,
+            email_inbox=settings.sender_email
+        )
+    except SMTPDeliveryUnknown as e:
+        # Reported as failed, but it may have been delivered; resending it could send it twice
+        success, error_message = False, str(e)
     if success:
-        successful_sends.append(request["recipient"])
+        successful_sends.append(request.recipient)
     else:
-        failed_sends[request["recipient"]] = error_message
+        failed_sends[request.recipient] = error_message
     
     # Add a delay between emails to avoid rate-limiting
     # delay = random.randint(30, 120)
@@ -175,5 +294,14 @@ async def send_scheduled_emails(background_tasks: BackgroundTasks):
     """
     Triggers the sending of all scheduled emails as a background task.
     """
-    background_tasks.add_task(cron.main)
+    # run_batch is a coroutine, so it runs on the event loop instead of holding a worker thread
+    background_tasks.add_task(cron.run_batch)
     return {"message": "Scheduled emails task has been initiated."}
+@app.post("/prerender-scheduled-emails", response_model=SuccessMessage)
+async def prerender_scheduled_emails(background_tasks: BackgroundTasks):
+    """
+    Builds the MIME payload of newly scheduled emails ahead of their send window.
+    Called by the frontend right after it inserts into scheduled-emails.
+    """
+    background_tasks.add_task(prerender.prerender_pending)
+    return {"message": "Pre-rendering of scheduled emails has been initiated."}
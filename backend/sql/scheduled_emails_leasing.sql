@@ -0,0 +1,70 @@
+-- Lease columns and claim/release functions used by lib/leasing.py.
+-- Run in the Supabase SQL editor; safe to re-run after it changes.
+
+alter table "scheduled-emails"
+    add column if not exists lease_token uuid,
+    add column if not exists lease_owner text,
+    add column if not exists lease_expires_at timestamptz;
+
+-- Set for rows that can never be sent as they are (e.g. no mailbox); the claim skips them.
+-- Clear it after fixing the row to queue it again.
+alter table "scheduled-emails"
+    add column if not exists send_error text;
+
+-- Unsent rows in (scheduled_time, id) order, for the claim below.
+-- Each page is a range scan starting at the previous page's last row, so it reads
+-- about p_limit rows however many are sent or still queued.
+create index if not exists scheduled_emails_due_idx
+    on "scheduled-emails" (sent, scheduled_time, id);
+
+-- Replaced by the version with the keyset cursor below
+drop function if exists claim_scheduled_emails(uuid, text, timestamptz, timestamptz, int, int);
+
+-- Atomically hands up to p_limit due, unleased (or lease-expired) rows without a send_error
+-- to one worker, oldest first.
+-- SKIP LOCKED lets concurrent workers claim disjoint batches without waiting on each other.
+-- p_after_time/p_after_id is the last row of the caller's previous page; rows up to it are skipped.
+create or replace function claim_scheduled_emails(
+    p_token uuid,
+    p_owner text,
+    p_window_start timestamptz,
+    p_window_end timestamptz,
+    p_limit int,
+    p_lease_seconds int,
+    p_after_time timestamptz default null,
+    p_after_id bigint default null
+)
+returns setof "scheduled-emails"
+language sql
+as $$
+    update "scheduled-emails" s
+    set lease_token = p_token,
+        lease_owner = p_owner,
+        lease_expires_at = now() + make_interval(secs => p_lease_seconds)
+    where s.id in (
+        select id
+        from "scheduled-emails"
+        where sent = false
+          and send_error is null
+          and scheduled_time between p_window_start and p_window_end
+          and (lease_expires_at is null or lease_expires_at < now())
+          and (p_after_time is null or (scheduled_time, id) > (p_after_time, p_after_id))
+        order by scheduled_time, id
+        limit p_limit
+        for update skip locked
+    )
+    returning s.*;
+$$;
+
+-- Gives rows back early (failed or deferred sends) so the next run does not wait for expiry.
+create or replace function release_scheduled_emails(p_token uuid, p_ids bigint[])
+returns void
+language sql
+as $$
+    update "scheduled-emails"
+    set lease_token = null,
+        lease_owner = null,
+        lease_expires_at = null
+    where lease_token = p_token
+      and id = any(p_ids);
+$$;
@@ -0,0 +1,27 @@
+-- Pre-rendered MIME payloads used by lib/prerender.py.
+-- Run once in the Supabase SQL editor.
+
+-- Serialized message without Date/Message-ID, and the hash of the fields it was built from
+alter table "scheduled-emails"
+    add column if not exists mime_payload text,
+    add column if not exists mime_hash text;
+
+-- Editing a row after it was rendered drops its payload, so it is rendered again.
+-- The claim leaves body_text out and trusts the stored payload of rows that have one.
+create or replace function scheduled_emails_clear_payload() returns trigger
+language plpgsql as $$
+begin
+    if (new.recipient, new.subject, new.body_text, new.sender_name, new.mailbox)
+           is distinct from (old.recipient, old.subject, old.body_text, old.sender_name, old.mailbox)
+       and new.mime_payload is not distinct from old.mime_payload then
+        new.mime_payload := null;
+        new.mime_hash := null;
+    end if;
+    return new;
+end;
+$$;
+
+drop trigger if exists scheduled_emails_clear_payload on "scheduled-emails";
+create trigger scheduled_emails_clear_payload
+    before update on "scheduled-emails"
+    for each row execute function scheduled_emails_clear_payload();
@@ -0,0 +1,9 @@
+-- Links each sent-emails row to the scheduled-emails row it came from, used by lib/sent_buffer.py.
+-- Run once in the Supabase SQL editor.
+
+-- A journal replayed after an ambiguous insert error upserts on this, so a send is recorded once
+alter table "sent-emails"
+    add column if not exists scheduled_id bigint;
+
+create unique index if not exists sent_emails_scheduled_id_idx
+    on "sent-emails" (scheduled_id);
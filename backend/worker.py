@@ -0,0 +1,90 @@
+from dotenv import load_dotenv
+import asyncio
+import os
+import socket
+import sys
+from lib import dossier
+from lib.browser_pool import BROWSER_POOL_SIZE
+from lib.browser_manager import BROWSER_COUNT
+from lib.jobs import get_job_queue, JOB_LEASE_SECONDS, JOB_TIMEOUT_SECONDS
+from lib.qualify import DEFAULT_CAMPAIGN
+from lib.llm import llm
+from lib.linkedin import linkedin
+from lib.metrics import register_browser_pool
+from lib.clients import BANNER, BROWSER_PRELAUNCH, get_browser_pool, browser_pool_stats, close_browser_pool
+from prometheus_client import start_http_server
+
+if sys.platform.startswith("win"):
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+load_dotenv()
+
+# --- WORKER CONFIG ---
+# Run as many `python worker.py` processes (on as many hosts, with JOB_QUEUE_BACKEND=redis) as needed
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", str(BROWSER_POOL_SIZE * BROWSER_COUNT)))
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "1"))
+WORKER_ID = os.getenv("WORKER_ID", f"{socket.gethostname()}-{os.getpid()}")
+# Serves this worker's /metrics for Prometheus to scrape; unset to disable
+WORKER_METRICS_PORT = os.getenv("WORKER_METRICS_PORT")
+
+
+async def process_generate_email(payload: dict) -> dict:
+    linkedin_request = await linkedin.request(payload.get("linkedin_url"))
+    # Chromium is launched by the first job the plain HTTP tier can't scrape
+    website_content = await dossier.extract_info_from_website(
+        payload["website_url"], campaign=payload.get("campaign", DEFAULT_CAMPAIGN)
+    )
+    if not website_content or not website_content["dossier"]:
+        raise RuntimeError("Could not scrape or summarize website content.")
+    linkedin_posts = await linkedin.posts(linkedin_request)
+    final_email = await dossier.generateCustomEmail(dossier.build_lead_dossier(payload, website_content, linkedin_posts))
+    return final_email.model_dump()
+
+
+JOB_HANDLERS = {
+    "generate-email": process_generate_email,
+}
+
+
+async def work(slot: int):
+    queue = get_job_queue()
+    worker = f"{WORKER_ID}/{slot}"
+    while True:
+        job = await asyncio.to_thread(queue.claim, worker, JOB_LEASE_SECONDS)
+        if job is None:
+            await asyncio.sleep(WORKER_POLL_SECONDS)
+            continue
+        print(f"[{worker}] Processing {job.kind} job {job.id} (attempt {job.attempts})")
+        try:
+            handler = JOB_HANDLERS[job.kind]
+            result = await asyncio.wait_for(handler(job.payload), timeout=JOB_TIMEOUT_SECONDS)
+            if await asyncio.to_thread(queue.complete, job.id, worker, result):
+                print(f"[{worker}] Job {job.id} done")
+            else:
+                print(f"[{worker}] Job {job.id} finished after its lease was lost, result dropped")
+        except Exception as e:
+            print(f"[{worker}] Job {job.id} failed: {e}")
+            await asyncio.to_thread(queue.fail, job.id, worker, str(e) or e.__class__.__name__)
+
+
+async def main():
+    print(BANNER)
+    print(f"Starting scraper worker {WORKER_ID} with {WORKER_CONCURRENCY} slot(s)...")
+    if JOB_TIMEOUT_SECONDS >= JOB_LEASE_SECONDS:
+        print(f"⚠️ JOB_TIMEOUT_SECONDS ({JOB_TIMEOUT_SECONDS:g}) is not below JOB_LEASE_SECONDS ({JOB_LEASE_SECONDS:g}), slow jobs will be claimed twice")
+    if BROWSER_PRELAUNCH:
+        await get_browser_pool()
+    if WORKER_METRICS_PORT:
+        register_browser_pool(browser_pool_stats)
+        start_http_server(int(WORKER_METRICS_PORT))
+    try:
+        await asyncio.gather(*(work(slot) for slot in range(WORKER_CONCURRENCY)))
+    finally:
+        await close_browser_pool()
+        await dossier.close_http_client()
+        await llm.close()
+        await linkedin.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
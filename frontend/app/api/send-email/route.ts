@@ -137,6 +137,12 @@ export async function POST(req: NextRequest) {
 
     if (insertError) throw new Error(insertError.message);
 
+    // Let the backend build the MIME payload now rather than inside the send window.
+    // Best effort: rows it misses are rendered at the end of the next cron run.
+    fetch(`${process.env.NEXT_PUBLIC_SERVER_URL}/prerender-scheduled-emails`, {
+      method: "POST",
+    }).catch((error) => console.error("prerender request failed", error.message));
+
     return Response.json(
       {
         success: true,